@@ -0,0 +1,78 @@
+"""Benchmark the database engine settings.
+
+Runs the same mixed workload twice against a scratch SQLite file. The first
+run uses the old settings: echo=True, default pool and default journaling.
+The second uses make_engine() with a separate read-only pool.
+
+Each client task loops over one score insert and several top-10 reads, then
+throughput is reported for both runs:
+
+    python bench_db.py --clients 32 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from db import Base, make_engine
+from models import LeaderboardEntry
+
+
+async def workload(write_engine, read_engine, clients, duration, reads_per_write):
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    top10 = select(LeaderboardEntry).order_by(LeaderboardEntry.score.desc()).limit(10)
+    counts = {"reads": 0, "writes": 0}
+    deadline = time.perf_counter() + duration
+
+    async def client(n):
+        i = 0
+        while time.perf_counter() < deadline:
+            async with write_engine.begin() as conn:
+                await conn.execute(insert(LeaderboardEntry).values(username=f"bench{n}", score=i))
+            counts["writes"] += 1
+            for _ in range(reads_per_write):
+                async with read_engine.connect() as conn:
+                    (await conn.execute(top10)).all()
+                counts["reads"] += 1
+            i += 1
+
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+    return {k: v / duration for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare default and tuned database engines")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--reads-per-write", type=int, default=4)
+    parser.add_argument("--env", default="production")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'before.db')}"
+        # echo=True logs every statement to stdout, exactly as the old default did
+        before_engine = create_async_engine(url, echo=True, future=True)
+        before = asyncio.run(workload(before_engine, before_engine, args.clients, args.duration,
+                                      args.reads_per_write))
+
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'after.db')}"
+        after_write = make_engine(url, env=args.env, log_sample_rate=0)
+        after_read = make_engine(url, env=args.env, read_only=True, log_sample_rate=0)
+        after = asyncio.run(workload(after_write, after_read, args.clients, args.duration, args.reads_per_write))
+
+    print(f"{'':8}{'writes/s':>12}{'reads/s':>12}")
+    print(f"{'before':8}{before['writes']:>12.0f}{before['reads']:>12.0f}")
+    print(f"{'after':8}{after['writes']:>12.0f}{after['reads']:>12.0f}")
+    print(f"speedup  writes x{after['writes'] / max(before['writes'], 1e-9):.2f}  "
+          f"reads x{after['reads'] / max(before['reads'], 1e-9):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure /login latency under concurrent load.
+
+Drives the ASGI app in-process against a scratch SQLite database and reports
+p50/p95/p99 login latency plus the worst event-loop stall seen by a
+heartbeat task. Run it twice to compare inline hashing with the pool:
+
+    python bench_login.py --workers 0      # hash on the event loop
+    python bench_login.py --workers 4      # bounded thread pool
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from loadtest import percentile
+
+
+async def run(args):
+    import httpx
+    from db import Base, engine
+    import main
+
+    main.password_hasher = main.PasswordHasher(n=args.scrypt_n, workers=args.workers, cache_ttl=0)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(args.users):
+            await client.post("/signup", json={"username": f"bench{i}", "password": f"pw{i}"})
+
+        latencies = []
+        max_stall = 0.0
+        deadline = time.perf_counter() + args.duration
+
+        async def heartbeat():
+            nonlocal max_stall
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                max_stall = max(max_stall, time.perf_counter() - start - 0.005)
+
+        async def login_loop(n):
+            i = n
+            while time.perf_counter() < deadline:
+                user = i % args.users
+                start = time.perf_counter()
+                r = await client.post("/login", json={"username": f"bench{user}", "password": f"pw{user}"})
+                latencies.append(time.perf_counter() - start)
+                assert r.json()["success"]
+                i += args.concurrency
+
+        await asyncio.gather(heartbeat(), *(login_loop(n) for n in range(args.concurrency)))
+
+    print(f"workers={args.workers} concurrency={args.concurrency} scrypt n={args.scrypt_n}")
+    print(f"  {len(latencies) / args.duration:.1f} logins/s")
+    for pct in (50, 95, 99):
+        print(f"  p{pct}: {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"  worst event-loop stall: {max_stall * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /login latency")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--scrypt-n", type=int, default=2 ** 14)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # db.py reads DATABASE_URL at import time, so set it before run() imports the app
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
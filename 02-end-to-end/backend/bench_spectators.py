@@ -0,0 +1,110 @@
+"""Load test for live game spectating.
+
+In-process mode (default) drives GameEngine + GameBroadcaster on one event
+loop with N consumer tasks standing in for spectator connections, and ramps N
+until a tick no longer fits in its interval or subscribers start dropping
+frames. --url mode opens real SSE connections against a running server:
+
+    python bench_spectators.py --spectators 1000 5000 20000
+    python bench_spectators.py --url http://localhost:8000 --game 1 --spectators 500
+"""
+import argparse
+import asyncio
+import time
+from broadcast import GameBroadcaster
+from db import SessionLocal
+from game_engine import GameEngine, SnakeSim
+from loadtest import percentile
+
+
+async def run_in_process(spectators, games, tick_interval, duration):
+    engine = GameEngine(SessionLocal, tick_interval=tick_interval)
+    broadcaster = GameBroadcaster()
+    engine.on_tick = broadcaster.on_tick
+    for game_id in range(games):
+        engine.add(SnakeSim(game_id, "bot", "pass-through"))
+    subs = [broadcaster.subscribe(engine.get(i % games)) for i in range(spectators)]
+    delivered = 0
+
+    async def consume(sub):
+        nonlocal delivered
+        while True:
+            await sub.next_frame()
+            delivered += 1
+
+    consumers = [asyncio.create_task(consume(sub)) for sub in subs]
+    loop = asyncio.get_running_loop()
+    tick_times = []
+    deadline = loop.time() + duration
+    next_tick = loop.time()
+    while loop.time() < deadline:
+        start = time.perf_counter()
+        engine.tick()
+        tick_times.append(time.perf_counter() - start)
+        next_tick += tick_interval
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    dropped = sum(sub.dropped for sub in subs)
+    return {
+        "spectators": spectators,
+        "ticks": len(tick_times),
+        "tick_p50_ms": percentile(tick_times, 50) * 1000,
+        "tick_p99_ms": percentile(tick_times, 99) * 1000,
+        "frames_per_s": delivered / duration,
+        "dropped": dropped,
+        "encoded": broadcaster.frames_encoded,
+    }
+
+
+async def run_over_http(url, game_id, spectators, duration):
+    import httpx
+
+    frames = 0
+
+    async def watch(client):
+        nonlocal frames
+        async with client.stream("GET", f"{url}/games/{game_id}/events") as response:
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    frames += 1
+
+    limits = httpx.Limits(max_connections=spectators)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        tasks = [asyncio.create_task(watch(client)) for _ in range(spectators)]
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"{spectators} spectators: {frames / duration:.0f} frames/s received")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spectators", type=int, nargs="+", default=[100, 1000, 5000, 10000, 20000])
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--tick-ms", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--url")
+    parser.add_argument("--game", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.url:
+        for n in args.spectators:
+            asyncio.run(run_over_http(args.url, args.game, n, args.duration))
+        return
+
+    tick_interval = args.tick_ms / 1000
+    sustained = 0
+    for n in args.spectators:
+        r = asyncio.run(run_in_process(n, args.games, tick_interval, args.duration))
+        print(f"{r['spectators']:>7} spectators  tick p50 {r['tick_p50_ms']:.2f} ms  p99 {r['tick_p99_ms']:.2f} ms  "
+              f"{r['frames_per_s']:.0f} frames/s  dropped {r['dropped']}  encoded {r['encoded']}")
+        if r["tick_p99_ms"] < args.tick_ms and r["dropped"] == 0:
+            sustained = n
+    print(f"Sustained without drops or tick overruns: {sustained} spectators")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from collections import deque
+
+
+def sse_frame(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
+class Subscriber:
+    """One spectator connection with a bounded frame buffer.
+
+    A subscriber that falls ``buffer_size`` frames behind has its backlog
+    discarded; it is then sent a full snapshot instead of the next delta, so
+    it resynchronises without the broadcaster ever waiting on it.
+    """
+
+    __slots__ = ("game_id", "frames", "buffer_size", "dropped", "needs_snapshot", "_ready")
+
+    def __init__(self, game_id, buffer_size):
+        self.game_id = game_id
+        self.frames = deque()
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self.needs_snapshot = False
+        self._ready = asyncio.Event()
+
+    def push(self, frame):
+        self.frames.append(frame)
+        self._ready.set()
+
+    def push_or_drop(self, frame):
+        if len(self.frames) >= self.buffer_size:
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            self.needs_snapshot = True
+            return False
+        self.push(frame)
+        return True
+
+    async def next_frame(self, timeout=None):
+        """Wait for the next frame; returns None if ``timeout`` passes first."""
+        while not self.frames:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.frames.popleft()
+
+
+class GameBroadcaster:
+    """Fans game-state frames out to every spectator of a game.
+
+    Called once per engine tick. Each watched game's delta (and, only when
+    some subscriber needs one, its snapshot) is encoded once and the same
+    bytes object is appended to every subscriber's buffer.
+    """
+
+    def __init__(self, buffer_size=16):
+        self.buffer_size = buffer_size
+        self.frames_encoded = 0
+        self._subscribers = {}
+        self._last_tick = {}
+
+    def subscriber_count(self, game_id=None):
+        if game_id is not None:
+            return len(self._subscribers.get(game_id, ()))
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, sim):
+        sub = Subscriber(sim.game_id, self.buffer_size)
+        sub.push(sse_frame("snapshot", sim.snapshot()))
+        self._subscribers.setdefault(sim.game_id, set()).add(sub)
+        self._last_tick.setdefault(sim.game_id, sim.ticks)
+        return sub
+
+    def unsubscribe(self, sub):
+        subs = self._subscribers.get(sub.game_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subscribers[sub.game_id]
+            self._last_tick.pop(sub.game_id, None)
+
+    def on_tick(self, engine):
+        for game_id, subs in self._subscribers.items():
+            sim = engine.get(game_id)
+            if sim is None or sim.ticks == self._last_tick.get(game_id):
+                continue
+            # A jump other than +1 means the game restarted or was reloaded
+            resync = sim.ticks != self._last_tick.get(game_id, -1) + 1
+            self._last_tick[game_id] = sim.ticks
+            self.publish(sim, subs, resync)
+
+    def publish(self, sim, subs, resync=False):
+        delta = None if resync else sse_frame("delta", sim.delta())
+        snapshot = None
+        self.frames_encoded += delta is not None
+        for sub in subs:
+            if resync or sub.needs_snapshot:
+                if snapshot is None:
+                    snapshot = sse_frame("snapshot", sim.snapshot())
+                    self.frames_encoded += 1
+                if sub.push_or_drop(snapshot):
+                    sub.needs_snapshot = False
+            else:
+                sub.push_or_drop(delta)
@@ -1,9 +1,88 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+import logging
 import os
+import random
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
+# Optional replica for read endpoints; SQLite uses a separate query-only pool instead
+DB_READ_URL = os.getenv("DATABASE_READ_URL")
+APP_ENV = os.getenv("APP_ENV", "development")
+# Fraction of SQL statements written to the "db.sql" logger (0 disables logging)
+SQL_LOG_SAMPLE_RATE = float(os.getenv("SQL_LOG_SAMPLE_RATE", "0"))
+
+POOL_SETTINGS = {
+    "development": {"pool_size": 5, "max_overflow": 5},
+    "test": {"pool_size": 2, "max_overflow": 2},
+    "production": {"pool_size": 20, "max_overflow": 20, "pool_recycle": 1800, "pool_pre_ping": True},
+}
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative means KiB, so 64 MiB
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+sql_logger = logging.getLogger("db.sql")
+
+
+def is_sqlite(url):
+    return url.startswith("sqlite")
+
+
+def is_sqlite_memory(url):
+    return is_sqlite(url) and (url.endswith(":memory:") or url.rstrip("/").endswith(":"))
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+
+def _sampled_logger(rate):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if random.random() < rate:
+            sql_logger.info("%s %r", statement, parameters)
+    return before_cursor_execute
+
+
+def make_engine(url=DB_URL, env=APP_ENV, read_only=False, log_sample_rate=SQL_LOG_SAMPLE_RATE, pragmas=None):
+    """Create an async engine with pool sizing for ``env`` and SQLite tuning.
+
+    SQLite connections get ``SQLITE_PRAGMAS`` (or ``pragmas``) on connect;
+    ``read_only`` engines skip the journal-mode change and set
+    ``query_only`` so they can never write.
+    """
+    kwargs = {} if is_sqlite_memory(url) else dict(POOL_SETTINGS[env])
+    engine = create_async_engine(url, future=True, **kwargs)
+    if is_sqlite(url):
+        pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        if read_only:
+            pragmas.pop("journal_mode", None)
+            pragmas["query_only"] = "ON"
+        event.listen(engine.sync_engine, "connect", _apply_pragmas(pragmas))
+    if log_sample_rate > 0:
+        event.listen(engine.sync_engine, "before_cursor_execute", _sampled_logger(log_sample_rate))
+    return engine
+
+
+engine = make_engine()
+if DB_READ_URL:
+    read_engine = make_engine(DB_READ_URL, read_only=True)
+elif is_sqlite(DB_URL) and not is_sqlite_memory(DB_URL):
+    read_engine = make_engine(DB_URL, read_only=True)
+else:
+    read_engine = engine
 
-engine = create_async_engine(DB_URL, echo=True, future=True)
 SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Sessions for endpoints that only read; never commit through these
+ReadSessionLocal = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
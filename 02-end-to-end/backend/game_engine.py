@@ -0,0 +1,342 @@
+import asyncio
+import base64
+import logging
+import random
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+from sqlalchemy import update
+from sqlalchemy.future import select
+from models import Game
+
+logger = logging.getLogger(__name__)
+
+GRID_SIZE = 15  # matches the frontend board
+
+EMPTY, SNAKE, FOOD = 0, 1, 2
+
+# up, right, down, left
+DIRECTIONS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# version, width, height, direction, alive, score, ticks, food, length
+_HEADER = struct.Struct("<BBBBBIIhH")
+_STATE_VERSION = 1
+# Placeholders of games that have not been played yet; anything else we cannot decode is left as stored
+_BLANK_STATES = ("", "{}")
+
+
+class SnakeSim:
+    """One snake game on a ``width`` x ``height`` board.
+
+    The board is a bytearray occupancy grid and the snake a deque of packed
+    cell indices (``y * width + x``) with the head on the left, so a step is a
+    handful of O(1) operations. Games steer themselves towards the food and
+    restart after dying, which keeps spectator games live.
+    """
+
+    __slots__ = ("game_id", "username", "mode", "width", "height", "board", "body", "direction",
+                 "food", "score", "alive", "ticks", "dead_for", "last_move", "rng", "dirty",
+                 "read_only", "_snapshot")
+
+    def __init__(self, game_id, username, mode, width=GRID_SIZE, height=GRID_SIZE, seed=None):
+        self.game_id = game_id
+        self.username = username
+        self.mode = mode
+        self.width = width
+        self.height = height
+        # Set for games whose stored state is not ours, so persist() never writes over it
+        self.read_only = False
+        self.rng = random.Random(seed if seed is not None else game_id)
+        self.reset()
+
+    def reset(self):
+        self.board = bytearray(self.width * self.height)
+        start = (self.height // 2) * self.width + self.width // 2
+        self.body = deque([start])
+        self.board[start] = SNAKE
+        self.direction = 1
+        self.score = 0
+        self.alive = True
+        self.ticks = 0
+        self.dead_for = 0
+        self.last_move = None
+        self._place_food()
+        self.dirty = True
+        self._snapshot = None
+
+    def _place_food(self):
+        cells = self.width * self.height
+        if len(self.body) >= cells:
+            self.food = -1
+            return
+        for _ in range(32):
+            cell = self.rng.randrange(cells)
+            if self.board[cell] == EMPTY:
+                break
+        else:
+            cell = self.board.find(EMPTY)
+        self.food = cell
+        self.board[cell] = FOOD
+
+    def _next_cell(self, direction):
+        head = self.body[0]
+        dx, dy = DIRECTIONS[direction]
+        x, y = head % self.width + dx, head // self.width + dy
+        if self.mode == "walls":
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return -1
+        else:
+            x %= self.width
+            y %= self.height
+        return y * self.width + x
+
+    def _is_safe(self, cell):
+        return cell != -1 and (self.board[cell] != SNAKE or cell == self.body[-1])
+
+    def _steer(self):
+        fx, fy = self.food % self.width, self.food // self.width
+        head = self.body[0]
+        hx, hy = head % self.width, head // self.width
+        preferred = []
+        if fx != hx:
+            preferred.append(1 if fx > hx else 3)
+        if fy != hy:
+            preferred.append(2 if fy > hy else 0)
+        candidates = preferred + [self.direction, (self.direction + 1) % 4, (self.direction + 3) % 4]
+        for direction in candidates:
+            if direction != (self.direction + 2) % 4 and self._is_safe(self._next_cell(direction)):
+                self.direction = direction
+                return
+
+    def step(self):
+        if not self.alive:
+            return
+        if self.food != -1:
+            self._steer()
+        cell = self._next_cell(self.direction)
+        self.ticks += 1
+        self.dirty = True
+        self._snapshot = None
+        self.last_move = None
+        if cell == -1:
+            self.alive = False
+            return
+        grow = cell == self.food
+        # Moving into the tail cell is fine unless the snake grows this tick
+        if self.board[cell] == SNAKE and (grow or cell != self.body[-1]):
+            self.alive = False
+            return
+        if not grow:
+            self.board[self.body.pop()] = EMPTY
+        self.board[cell] = SNAKE
+        self.body.appendleft(cell)
+        self.last_move = (cell, grow)
+        if grow:
+            self.score += 1
+            self._place_food()
+
+    def snapshot(self):
+        if self._snapshot is None:
+            w = self.width
+            self._snapshot = {
+                "id": self.game_id,
+                "username": self.username,
+                "mode": self.mode,
+                "snake": [{"x": cell % w, "y": cell // w} for cell in self.body],
+                "food": {"x": self.food % w, "y": self.food // w} if self.food != -1 else None,
+                "score": self.score,
+                "alive": self.alive,
+                "tick": self.ticks,
+            }
+        return self._snapshot
+
+    def delta(self):
+        """Changes made by the last step, for spectators that already hold a snapshot."""
+        w = self.width
+        frame = {"tick": self.ticks, "score": self.score, "alive": self.alive, "head": None, "grow": False}
+        if self.last_move is not None:
+            cell, grow = self.last_move
+            frame["head"] = {"x": cell % w, "y": cell // w}
+            frame["grow"] = grow
+            if grow:
+                frame["food"] = {"x": self.food % w, "y": self.food // w} if self.food != -1 else None
+        return frame
+
+    def encode(self):
+        """Pack the game into the compact base64 form stored in ``Game.state``."""
+        body = array("H", self.body)
+        if sys.byteorder == "big":
+            body.byteswap()
+        header = _HEADER.pack(_STATE_VERSION, self.width, self.height, self.direction, self.alive,
+                              self.score, self.ticks, self.food, len(body))
+        return base64.b64encode(header + body.tobytes()).decode("ascii")
+
+    @classmethod
+    def decode(cls, game_id, username, mode, state):
+        """Rebuild a game from ``Game.state``; returns None if it is not in our format or out of bounds."""
+        try:
+            raw = base64.b64decode(state, validate=True)
+            version, width, height, direction, alive, score, ticks, food, length = _HEADER.unpack_from(raw)
+        except (ValueError, struct.error):
+            return None
+        if version != _STATE_VERSION or len(raw) != _HEADER.size + 2 * length:
+            return None
+        cells = width * height
+        if not cells or not length or direction >= len(DIRECTIONS) or not -1 <= food < cells:
+            return None
+        body = array("H")
+        body.frombytes(raw[_HEADER.size:])
+        if sys.byteorder == "big":
+            body.byteswap()
+        if max(body) >= cells:
+            return None
+        sim = cls(game_id, username, mode, width, height)
+        sim.board = bytearray(width * height)
+        sim.body = deque(body)
+        for cell in sim.body:
+            sim.board[cell] = SNAKE
+        sim.food = food
+        if food != -1:
+            sim.board[food] = FOOD
+        sim.direction, sim.alive, sim.score, sim.ticks = direction, bool(alive), score, ticks
+        sim.dead_for = 0
+        sim.last_move = None
+        sim.dirty = False
+        return sim
+
+
+class GameEngine:
+    """Steps every live game once per tick on the running event loop.
+
+    ``GET /games/{id}`` reads snapshots straight from memory; game state is
+    written back to ``Game.state`` every ``persist_interval`` seconds with one
+    executemany UPDATE covering the games that changed since the last flush.
+
+    At most ``max_games`` games are simulated, in LRU order of ``get()``:
+    startup loads the newest ones, and the least recently viewed game is
+    evicted (its state still persisted) when another one is loaded.
+    """
+
+    def __init__(self, session_factory, tick_interval=0.2, persist_interval=5.0, restart_delay=10,
+                 max_games=10_000):
+        self.session_factory = session_factory
+        self.tick_interval = tick_interval
+        self.persist_interval = persist_interval
+        self.restart_delay = restart_delay
+        self.max_games = max_games
+        self.games = OrderedDict()
+        self.on_tick = None
+        self._evicted = {}
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def get(self, game_id):
+        sim = self.games.get(game_id)
+        if sim is not None:
+            self.games.move_to_end(game_id)
+        return sim
+
+    def add(self, sim):
+        self.games[sim.game_id] = sim
+        self.games.move_to_end(sim.game_id)
+        while len(self.games) > self.max_games:
+            _, evicted = self.games.popitem(last=False)
+            if evicted.dirty and not evicted.read_only:
+                # Written by the next persist(), or picked up again if reloaded first
+                self._evicted[evicted.game_id] = evicted
+        return sim
+
+    def sim_from_row(self, game):
+        sim = self._evicted.pop(game.id, None)
+        if sim is None:
+            sim = SnakeSim.decode(game.id, game.username, game.mode, game.state)
+        if sim is None:
+            sim = SnakeSim(game.id, game.username, game.mode)
+            if game.state not in _BLANK_STATES:
+                logger.warning("game %s has a state this engine cannot decode; simulating it without saving", game.id)
+                sim.read_only = True
+        return self.add(sim)
+
+    async def load(self, db):
+        result = await db.execute(
+            select(Game.id, Game.username, Game.mode, Game.state).order_by(Game.id.desc()).limit(self.max_games)
+        )
+        # Oldest first, so the newest games end up most recently used
+        for game in reversed(result.all()):
+            if game.id not in self.games:
+                self.sim_from_row(game)
+
+    def tick(self):
+        failed = []
+        for sim in self.games.values():
+            try:
+                if sim.alive:
+                    sim.step()
+                else:
+                    sim.dead_for += 1
+                    if sim.dead_for >= self.restart_delay:
+                        sim.reset()
+            except Exception:
+                logger.exception("game %s failed to step; removing it from the simulation", sim.game_id)
+                failed.append(sim.game_id)
+        for game_id in failed:
+            del self.games[game_id]
+        if self.on_tick is not None:
+            try:
+                self.on_tick(self)
+            except Exception:
+                logger.exception("on_tick failed")
+
+    async def persist(self):
+        dirty = [sim for sim in self.games.values() if sim.dirty and not sim.read_only]
+        evicted = list(self._evicted.values())
+        dirty += evicted
+        if not dirty:
+            return
+        params = [{"id": sim.game_id, "state": sim.encode()} for sim in dirty]
+        async with self.session_factory() as session:
+            async with session.begin():
+                # ORM bulk UPDATE by primary key: one executemany for the batch
+                await session.execute(update(Game), params)
+        for sim in dirty:
+            sim.dirty = False
+        for sim in evicted:
+            if self._evicted.get(sim.game_id) is sim:
+                del self._evicted[sim.game_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        last_persist = time.monotonic()
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("game tick failed")
+            if time.monotonic() - last_persist >= self.persist_interval:
+                last_persist = time.monotonic()
+                try:
+                    await self.persist()
+                except Exception:
+                    logger.exception("failed to persist game state")
+            next_tick += self.tick_interval
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.persist()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from sqlalchemy import insert
+from models import LeaderboardEntry
+
+DURABILITY_MODES = ("flush", "enqueue")
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class IngestQueueClosed(Exception):
+    pass
+
+
+class ScoreIngestQueue:
+    """Write-behind ingestion for leaderboard scores.
+
+    Submissions are queued and a single worker task groups them into
+    micro-batches of at most ``max_batch`` rows, waiting no longer than
+    ``max_delay`` seconds for a batch to fill. Each batch is written with one
+    multi-row INSERT inside one transaction, so SQLite pays one fsync per
+    batch instead of one per score.
+
+    ``durability="flush"`` acknowledges a submission only after its batch has
+    committed; ``durability="enqueue"`` acknowledges as soon as the score is
+    queued and trades a crash window for lower latency. When the queue is full
+    ``submit`` waits up to ``enqueue_timeout`` seconds and then raises
+    ``IngestQueueFull`` so the caller can shed load. Once ``stop`` has been
+    called ``submit`` raises ``IngestQueueClosed``, since the worker will not
+    read past the stop marker.
+    """
+
+    def __init__(self, session_factory, max_batch=500, max_delay=0.005, max_queue=10000,
+                 durability="flush", enqueue_timeout=1.0, on_flush=None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got {durability!r}")
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+        self.on_flush = on_flush
+        self.batches_flushed = 0
+        self.rows_flushed = 0
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._stopping = False
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    def accepts_from_current_loop(self):
+        try:
+            return self.running and not self._stopping and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stopping = False
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything already queued, then stop the worker."""
+        if not self.running or self._stopping:
+            return
+        # Submissions already waiting for queue space are ahead of the marker
+        self._stopping = True
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+    async def submit(self, username, score):
+        if self._stopping:
+            raise IngestQueueClosed("score queue is shutting down")
+        future = self._loop.create_future() if self.durability == "flush" else None
+        try:
+            await asyncio.wait_for(self._queue.put((username, score, future)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise IngestQueueFull(f"score queue is full ({self.max_queue} pending)")
+        if future is not None:
+            await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = self._loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        rows = [{"username": username, "score": score} for username, score, _ in batch]
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        insert(LeaderboardEntry).returning(LeaderboardEntry.id, sort_by_parameter_order=True),
+                        rows,
+                    )
+                    ids = result.scalars().all()
+        except Exception as e:
+            logger.exception("failed to flush %d scores", len(batch))
+            for _, _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        self.batches_flushed += 1
+        self.rows_flushed += len(rows)
+        # The rows are committed, so acknowledge them whatever on_flush does
+        for _, _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+        if self.on_flush is not None:
+            try:
+                self.on_flush([(entry_id, row["username"], row["score"]) for entry_id, row in zip(ids, rows)])
+            except Exception:
+                logger.exception("on_flush failed for %d scores", len(rows))
@@ -2,9 +2,17 @@ import asyncio
 from db import engine, Base
 from models import User, LeaderboardEntry, Game
 
+def create_indexes(conn):
+    # create_all skips tables that already exist, and with them any index
+    # added to the models since, so create those one by one if missing
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_indexes)
 
 if __name__ == "__main__":
     asyncio.run(init_db())
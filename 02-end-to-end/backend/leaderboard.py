@@ -0,0 +1,80 @@
+import heapq
+from sqlalchemy.future import select
+from models import LeaderboardEntry
+
+
+class TopKLeaderboard:
+    """Keeps the best K leaderboard entries in process memory.
+
+    Entries are held in a min-heap of ``(score, -id, username)`` so the weakest
+    entry sits at the root and a new score is accepted or rejected in O(log K).
+    Ties are broken by submission order (lower id ranks higher), which matches
+    ``ORDER BY score DESC, id ASC`` in the database. Reads are served from a
+    cached, pre-sorted list that is only rebuilt after the heap changes.
+
+    The index is per process: with several workers, each one sees the scores
+    it persisted itself plus whatever was in the table when it was warmed.
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.loaded = False
+        self._heap = []
+        self._top = []
+
+    def _query(self):
+        return (
+            select(LeaderboardEntry)
+            .order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.id.asc())
+            .limit(self.k)
+        )
+
+    async def warm(self, db):
+        result = await db.execute(self._query())
+        heap = [(e.score, -e.id, e.username) for e in result.scalars().all()]
+        heapq.heapify(heap)
+        self._heap = heap
+        self._top = None
+        self.loaded = True
+
+    async def ensure_warm(self, db):
+        if not self.loaded:
+            await self.warm(db)
+
+    def add(self, entry_id, username, score):
+        if not self.loaded:
+            # The next warm() reads the committed row from the table.
+            return
+        item = (score, -entry_id, username)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+        else:
+            return
+        self._top = None
+
+    def top(self):
+        if self._top is None:
+            self._top = [
+                {"username": username, "score": score}
+                for score, _, username in sorted(self._heap, reverse=True)
+            ]
+        return self._top
+
+    async def check_consistency(self, db):
+        """Compare the in-memory top K with the ``leaderboard`` table.
+
+        Returns a list of human-readable mismatches; an empty list means the
+        index agrees with the database.
+        """
+        result = await db.execute(self._query())
+        expected = [(e.id, e.username, e.score) for e in result.scalars().all()]
+        actual = [(-neg_id, username, score) for score, neg_id, username in sorted(self._heap, reverse=True)]
+        problems = []
+        if len(expected) != len(actual):
+            problems.append(f"size mismatch: db has {len(expected)}, index has {len(actual)}")
+        for rank, (want, got) in enumerate(zip(expected, actual), 1):
+            if want != got:
+                problems.append(f"rank {rank}: db has {want}, index has {got}")
+        return problems
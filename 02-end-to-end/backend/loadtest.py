@@ -0,0 +1,272 @@
+"""Mixed-workload load test for the snake backend.
+
+By default the ASGI app runs in-process (with its lifespan) against a scratch
+SQLite database. --uvicorn starts a real uvicorn server in a subprocess on
+the same scratch database. --url targets a server that is already running.
+Results hold throughput and p50/p95/p99 latency per operation and are written
+as JSON. --compare checks them against an earlier run and exits non-zero on
+regressions:
+
+    python loadtest.py --duration 20 --out baseline.json
+    python loadtest.py --duration 20 --out new.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_MIX = "login=1,leaderboard_read=6,leaderboard_write=2,game_poll=6"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def op_login(client, ctx, rng):
+    user = rng.randrange(ctx["users"])
+    r = await client.post("/login", json={"username": f"load{user}", "password": f"pw{user}"})
+    return r.status_code == 200 and r.json().get("success")
+
+
+async def op_leaderboard_read(client, ctx, rng):
+    r = await client.get("/leaderboard")
+    return r.status_code == 200
+
+
+async def op_leaderboard_write(client, ctx, rng):
+    r = await client.post("/leaderboard", json={"username": f"load{rng.randrange(ctx['users'])}",
+                                                 "score": rng.randrange(10_000)})
+    return r.status_code == 200
+
+
+async def op_game_poll(client, ctx, rng):
+    if not ctx["game_ids"]:
+        return False
+    r = await client.get(f"/games/{rng.choice(ctx['game_ids'])}")
+    return r.status_code == 200
+
+
+OPERATIONS = {
+    "login": op_login,
+    "leaderboard_read": op_leaderboard_read,
+    "leaderboard_write": op_leaderboard_write,
+    "game_poll": op_game_poll,
+}
+
+
+async def seed(client, args):
+    for i in range(args.users):
+        await client.post("/signup", json={"username": f"load{i}", "password": f"pw{i}"})
+    r = await client.get("/games", params={"limit": 1000, "include_state": False})
+    return [g["id"] for g in r.json()]
+
+
+async def seed_games(count):
+    from db import Base, SessionLocal, engine
+    from models import Game
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        db.add_all(Game(username=f"load{i}", mode="pass-through" if i % 2 else "walls", state="") for i in range(count))
+        await db.commit()
+    await engine.dispose()
+
+
+async def drive(client, args, mix):
+    ctx = {"users": args.users, "game_ids": await seed(client, args)}
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    async def worker(n, deadline, record):
+        rng = random.Random(args.seed + n)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = await OPERATIONS[name](client, ctx, rng)
+            except Exception:
+                ok = False
+            if record:
+                samples[name].append(time.perf_counter() - start)
+                errors[name] += not ok
+
+    if args.warmup:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(worker(n, deadline, False) for n in range(args.concurrency)))
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(*(worker(n, deadline, True) for n in range(args.concurrency)))
+    return samples, errors
+
+
+def summarize(samples, errors, duration):
+    ops = {}
+    for name, values in samples.items():
+        ops[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput": len(values) / duration,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values, default=0.0) * 1000,
+        }
+    everything = [v for values in samples.values() for v in values]
+    ops["total"] = {
+        "requests": len(everything),
+        "errors": sum(errors.values()),
+        "throughput": len(everything) / duration,
+        "p50_ms": percentile(everything, 50) * 1000,
+        "p95_ms": percentile(everything, 95) * 1000,
+        "p99_ms": percentile(everything, 99) * 1000,
+        "max_ms": max(everything, default=0.0) * 1000,
+    }
+    return ops
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, now in results["operations"].items():
+        before = baseline["operations"].get(name)
+        if before is None:
+            continue
+        if before["throughput"] and now["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {now['throughput']:.1f} req/s")
+        if before["p99_ms"] and now["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {before['p99_ms']:.2f} -> {now['p99_ms']:.2f} ms")
+    return regressions
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_server(url, timeout=30):
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get(url + "/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"server at {url} did not start within {timeout}s")
+
+
+async def run(args, mix):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+            return await drive(client, args, mix)
+
+    await seed_games(args.games)
+    if args.uvicorn:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        try:
+            url = f"http://127.0.0.1:{port}"
+            await wait_for_server(url)
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+                return await drive(client, args, mix)
+        finally:
+            server.terminate()
+            server.wait()
+
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=30) as client:
+            return await drive(client, args, mix)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed-workload load test for the snake backend")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="target an already running server instead of the in-process app")
+    parser.add_argument("--uvicorn", action="store_true", help="serve the app with uvicorn in a subprocess")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.url:
+            # db.py reads DATABASE_URL at import time, so set it before anything imports it
+            os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+            os.environ.setdefault("SESSION_BACKEND", "memory")
+        samples, errors = asyncio.run(run(args, mix))
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.url or ("uvicorn" if args.uvicorn else "in-process"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "operations": summarize(samples, errors, args.duration),
+    }
+
+    print(f"{'operation':<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, op in results["operations"].items():
+        print(f"{name:<20}{op['throughput']:>10.1f}{op['p50_ms']:>10.2f}{op['p95_ms']:>10.2f}"
+              f"{op['p99_ms']:>10.2f}{op['errors']:>8}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
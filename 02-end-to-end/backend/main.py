@@ -1,19 +1,94 @@
 
 
-from fastapi import FastAPI, HTTPException, Header, Path, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Header, Path, Query, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, List
-import random
+import json
 import string
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from db import SessionLocal
+from contextlib import asynccontextmanager
+from db import SessionLocal, ReadSessionLocal, engine, read_engine
 from models import User, LeaderboardEntry, Game
+from leaderboard import TopKLeaderboard
+from ranking import UserRanking
+from ingest import ScoreIngestQueue, IngestQueueFull
+from session_store import create_session_store
+from user_cache import UserCache
+from game_engine import GameEngine
+from passwords import PasswordHasher
+from metrics import Metrics, MetricsMiddleware, StackSampler, instrument_engine
+from broadcast import GameBroadcaster, KEEPALIVE_FRAME
+import os
 import uuid
 
-app = FastAPI()
+# Top 10 scores kept in memory so GET /leaderboard never touches the table
+leaderboard = TopKLeaderboard(k=10)
+# Best score per user, for rank lookups
+rankings = UserRanking()
+
+
+def record_scores(rows):
+    for entry_id, username, score in rows:
+        leaderboard.add(entry_id, username, score)
+        rankings.add(username, score)
+
+
+# Batched write-behind ingestion for POST /leaderboard
+score_ingest = ScoreIngestQueue(
+    SessionLocal,
+    max_batch=int(os.getenv("SCORE_BATCH_SIZE", "500")),
+    max_delay=float(os.getenv("SCORE_BATCH_DELAY_MS", "5")) / 1000,
+    max_queue=int(os.getenv("SCORE_QUEUE_SIZE", "10000")),
+    durability=os.getenv("SCORE_DURABILITY", "flush"),
+    on_flush=record_scores,
+)
+
+
+# Server-side snake simulation backing /games/{gameId}
+game_engine = GameEngine(
+    SessionLocal,
+    tick_interval=float(os.getenv("GAME_TICK_MS", "200")) / 1000,
+    persist_interval=float(os.getenv("GAME_PERSIST_SECONDS", "5")),
+    max_games=int(os.getenv("GAME_MAX_LOADED", "10000")),
+)
+# Pushes per-tick game deltas to spectators of /games/{gameId}/events
+broadcaster = GameBroadcaster(buffer_size=int(os.getenv("SPECTATOR_BUFFER_FRAMES", "16")))
+game_engine.on_tick = broadcaster.on_tick
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with SessionLocal() as db:
+        await leaderboard.warm(db)
+        await rankings.warm(db)
+        await game_engine.load(db)
+    await score_ingest.start()
+    await game_engine.start()
+    yield
+    await game_engine.stop()
+    await score_ingest.stop()
+    await sessions.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-route latency and DB time, exported at /metrics. Setting PROFILE_DIR
+# turns on the stack sampler, which dumps folded stacks of slow requests there.
+metrics = Metrics(slow_threshold=float(os.getenv("SLOW_REQUEST_MS", "500")) / 1000)
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine)
+sampler = StackSampler(os.environ["PROFILE_DIR"], hz=int(os.getenv("PROFILE_HZ", "100"))) if os.getenv("PROFILE_DIR") else None
+app.add_middleware(MetricsMiddleware, metrics=metrics, sampler=sampler)
+metrics.gauge("user_cache_hits", "GET /user profile cache hits.", lambda: user_cache.hits)
+metrics.gauge("user_cache_misses", "GET /user profile cache misses.", lambda: user_cache.misses)
+metrics.gauge("score_ingest_rows_flushed", "Scores written by the ingest queue.", lambda: score_ingest.rows_flushed)
+metrics.gauge("score_ingest_batches_flushed", "Batches written by the ingest queue.", lambda: score_ingest.batches_flushed)
+metrics.gauge("games_simulated", "Games loaded into the simulation engine.", lambda: len(game_engine.games))
+metrics.gauge("game_spectators", "Open /games/{gameId}/events streams.", lambda: broadcaster.subscriber_count())
 
 # Allow CORS for frontend
 app.add_middleware(
@@ -24,8 +99,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory session tokens (for demo; use DB/Redis for prod)
-sessions = {}
+# Session tokens; SESSION_BACKEND picks memory, sqlite or redis
+sessions = create_session_store()
+# scrypt hashing on a bounded thread pool so logins never stall the loop
+password_hasher = PasswordHasher(
+    n=int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14))),
+    r=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+    p=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2))),
+)
+# Resolved GET /user profiles, keyed by token
+user_cache = UserCache(ttl=int(os.getenv("USER_CACHE_TTL", "300")))
 
 def generate_token():
     return str(uuid.uuid4())
@@ -35,20 +119,37 @@ async def get_db():
         yield session
 
 
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        yield session
+
+
 @app.get("/")
 async def homepage():
     return {"message": "Welcome to the Snake Game API"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/login")
 async def login(data: dict, db: AsyncSession = Depends(get_db)):
     username = data.get("username")
     password = data.get("password")
-    result = await db.execute(select(User).where(User.username == username, User.password == password))
+    result = await db.execute(select(User).where(User.username == username))
     user = result.scalar_one_or_none()
-    if user:
+    if user is None and isinstance(password, str):
+        await password_hasher.verify_unknown(password)
+    elif user and isinstance(password, str) and await password_hasher.verify(user.password, password):
+        if password_hasher.needs_rehash(user.password):
+            # Plaintext legacy rows and outdated cost parameters are upgraded here
+            user.password = await password_hasher.hash(password)
+            await db.commit()
+            user_cache.invalidate_user(user.id)
         token = generate_token()
-        sessions[token] = user.id
+        await sessions.set(token, user.id)
         return {"success": True, "token": token, "username": user.username}
     return {"success": False, "error": "Invalid credentials"}
 
@@ -57,7 +158,9 @@ async def login(data: dict, db: AsyncSession = Depends(get_db)):
 async def signup(data: dict, db: AsyncSession = Depends(get_db)):
     username = data.get("username")
     password = data.get("password")
-    user = User(username=username, password=password)
+    if not username or not isinstance(password, str):
+        return {"success": False, "error": "Username and password are required"}
+    user = User(username=username, password=await password_hasher.hash(password))
     db.add(user)
     try:
         await db.commit()
@@ -68,67 +171,157 @@ async def signup(data: dict, db: AsyncSession = Depends(get_db)):
 
 
 @app.get("/user")
-async def get_user(Authorization: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+async def get_user(Authorization: Optional[str] = Header(None), db: AsyncSession = Depends(get_read_db)):
     token = Authorization
-    user_id = sessions.get(token)
+    user_id = await sessions.get(token) if token else None
     if not user_id:
+        if token:
+            user_cache.invalidate_token(token)
         raise HTTPException(status_code=401, detail="Invalid token")
+    profile = user_cache.get(token, user_id)
+    if profile is not None:
+        return profile
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
     if user:
-        return {"username": user.username}
+        profile = {"username": user.username}
+        user_cache.put(token, user_id, profile)
+        return profile
     raise HTTPException(status_code=401, detail="Invalid token")
 
 
+@app.get("/user/cache-stats")
+async def get_user_cache_stats():
+    return user_cache.stats()
+
+
 @app.post("/logout")
 async def logout(Authorization: Optional[str] = Header(None)):
     token = Authorization
-    if token in sessions:
-        del sessions[token]
+    if token:
+        await sessions.delete(token)
+        user_cache.invalidate_token(token)
     return {"success": True}
 
 
 @app.get("/leaderboard")
-async def get_leaderboard(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(LeaderboardEntry).order_by(LeaderboardEntry.score.desc()).limit(10))
-    entries = result.scalars().all()
-    return [{"username": e.username, "score": e.score} for e in entries]
+async def get_leaderboard(db: AsyncSession = Depends(get_read_db)):
+    await leaderboard.ensure_warm(db)
+    return leaderboard.top()
+
+
+@app.get("/leaderboard/consistency")
+async def check_leaderboard(db: AsyncSession = Depends(get_read_db)):
+    await leaderboard.ensure_warm(db)
+    problems = await leaderboard.check_consistency(db)
+    return {"consistent": not problems, "problems": problems}
+
+
+@app.get("/leaderboard/rank/{username}")
+async def get_rank(username: str, db: AsyncSession = Depends(get_read_db)):
+    await rankings.ensure_warm(db)
+    rank = rankings.rank(username)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User has no scores")
+    return {"username": username, "score": rankings.best_score(username), "rank": rank, "total": len(rankings)}
+
+
+@app.get("/leaderboard/around/{username}")
+async def get_around(username: str, window: int = Query(5, ge=0, le=50), db: AsyncSession = Depends(get_read_db)):
+    await rankings.ensure_warm(db)
+    entries = rankings.around(username, window)
+    if entries is None:
+        raise HTTPException(status_code=404, detail="User has no scores")
+    return entries
 
 
 @app.post("/leaderboard")
 async def submit_score(data: dict, db: AsyncSession = Depends(get_db)):
     username = data.get("username")
     score = data.get("score")
+    # Validated up front: one bad row would fail the whole batch it is written in
+    if not isinstance(username, str) or not username:
+        raise HTTPException(status_code=422, detail="username must be a non-empty string")
+    if not isinstance(score, int) or isinstance(score, bool):
+        raise HTTPException(status_code=422, detail="score must be an integer")
+    if score_ingest.accepts_from_current_loop():
+        try:
+            await score_ingest.submit(username, score)
+        except IngestQueueFull:
+            raise HTTPException(status_code=503, detail="Score queue is full", headers={"Retry-After": "1"})
+        return {"success": True}
     entry = LeaderboardEntry(username=username, score=score)
     db.add(entry)
     await db.commit()
+    record_scores([(entry.id, entry.username, entry.score)])
     return {"success": True}
 
 
 @app.get("/games")
-async def get_active_games(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Game))
-    games = result.scalars().all()
-    return [
-        {"id": g.id, "username": g.username, "mode": g.mode, "state": g.state}
-        for g in games
-    ]
+async def get_active_games(
+    after: Optional[int] = Query(None, description="Return games with id greater than this cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    mode: Optional[str] = None,
+    username: Optional[str] = None,
+    include_state: bool = True,
+):
+    """Keyset-paginated game listing, streamed as a JSON array.
+
+    Pass the id of the last game received as ``after`` to fetch the next page.
+    """
+    columns = [Game.id, Game.username, Game.mode] + ([Game.state] if include_state else [])
+    stmt = select(*columns).order_by(Game.id).limit(limit)
+    if after is not None:
+        stmt = stmt.where(Game.id > after)
+    if mode is not None:
+        stmt = stmt.where(Game.mode == mode)
+    if username is not None:
+        stmt = stmt.where(Game.username == username)
+
+    async def rows():
+        # The body outlives the request's dependencies, so it opens its own session
+        async with ReadSessionLocal() as session:
+            result = await session.stream(stmt)
+            opened = False
+            async for partition in result.partitions(500):
+                chunk = ",".join(json.dumps(row._asdict(), separators=(",", ":")) for row in partition)
+                yield (b"," if opened else b"[") + chunk.encode()
+                opened = True
+            yield b"]" if opened else b"[]"
+
+    return StreamingResponse(rows(), media_type="application/json")
+
+
+async def load_sim(game_id, db):
+    sim = game_engine.get(game_id)
+    if sim is None:
+        # Games created after startup are loaded into the engine on first view
+        result = await db.execute(select(Game).where(Game.id == game_id))
+        game = result.scalar_one_or_none()
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+        sim = game_engine.sim_from_row(game)
+    return sim
 
 
 @app.get("/games/{gameId}")
-async def get_game_state(gameId: int = Path(...), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Game).where(Game.id == gameId))
-    game = result.scalar_one_or_none()
-    if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
-    return {
-        "id": game.id,
-        "username": game.username,
-        "mode": game.mode,
-        "snake": [
-            {"x": random.randint(0, 9), "y": random.randint(0, 9)},
-            {"x": random.randint(0, 9), "y": random.randint(0, 9)},
-        ],
-        "food": {"x": random.randint(0, 9), "y": random.randint(0, 9)},
-        "score": random.randint(0, 20),
-    }
+async def get_game_state(gameId: int = Path(...), db: AsyncSession = Depends(get_read_db)):
+    sim = await load_sim(gameId, db)
+    return sim.snapshot()
+
+
+@app.get("/games/{gameId}/events")
+async def watch_game(gameId: int = Path(...), db: AsyncSession = Depends(get_read_db)):
+    """Server-Sent Events stream: one ``snapshot`` event, then a ``delta`` per tick."""
+    sim = await load_sim(gameId, db)
+    subscriber = broadcaster.subscribe(sim)
+
+    async def frames():
+        try:
+            while True:
+                frame = await subscriber.next_frame(timeout=15)
+                yield frame if frame is not None else KEEPALIVE_FRAME
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
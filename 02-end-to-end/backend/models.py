@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from db import Base
 
@@ -12,7 +12,7 @@ class LeaderboardEntry(Base):
     __tablename__ = 'leaderboard'
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, nullable=False)
-    score = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=False, index=True)
 
 class Game(Base):
     __tablename__ = 'games'
@@ -20,3 +20,8 @@ class Game(Base):
     username = Column(String, nullable=False)
     mode = Column(String, nullable=False)
     state = Column(String, nullable=False)
+    # Keyset pagination of GET /games filtered by mode or username
+    __table_args__ = (
+        Index('ix_games_mode_id', 'mode', 'id'),
+        Index('ix_games_username_id', 'username', 'id'),
+    )
@@ -0,0 +1,94 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PREFIX = "scrypt"
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+class PasswordHasher:
+    """scrypt password hashing kept off the event loop.
+
+    Hashes are stored as ``scrypt$n$r$p$salt$hash``. Hashing and verification
+    run on a bounded thread pool (hashlib.scrypt releases the GIL, so threads
+    give real parallelism); ``workers=0`` hashes inline, which only makes sense
+    for benchmarks. Successful verifications are remembered for ``cache_ttl``
+    seconds, keyed by an HMAC of the stored hash and the password under a
+    per-process secret, so repeat logins skip the KDF without keeping the
+    password itself anywhere.
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=4, cache_size=10_000, cache_ttl=300):
+        self.n, self.r, self.p = n, r, p
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash") if workers else None
+        self._cache_key = secrets.token_bytes(32)
+        self._verified = OrderedDict()
+        self._dummy_hash = None
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+    def hash_sync(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{PREFIX}${self.n}${self.r}${self.p}${_b64(salt)}${_b64(digest)}"
+
+    def verify_sync(self, stored, password):
+        if not stored.startswith(PREFIX + "$"):
+            # Legacy plaintext row, upgraded by the caller after a successful login
+            return hmac.compare_digest(stored.encode(), password.encode())
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            expected = base64.b64decode(digest)
+            actual = self._derive(password, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, stored):
+        return not stored.startswith(f"{PREFIX}${self.n}${self.r}${self.p}$")
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def hash(self, password):
+        return await self._run(self.hash_sync, password)
+
+    async def verify_unknown(self, password):
+        """Spend a full verification on a user that does not exist, and fail.
+
+        Keeps a login for an unknown username as slow as a wrong password, so
+        response times do not reveal which usernames are registered.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = await self.hash(secrets.token_hex(16))
+        await self._run(self.verify_sync, self._dummy_hash, password)
+        return False
+
+    async def verify(self, stored, password):
+        key = hmac.new(self._cache_key, f"{stored}\0{password}".encode(), hashlib.sha256).digest()
+        expires_at = self._verified.get(key)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                return True
+            del self._verified[key]
+        ok = await self._run(self.verify_sync, stored, password)
+        if ok:
+            self._verified[key] = time.monotonic() + self.cache_ttl
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return ok
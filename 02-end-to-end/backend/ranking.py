@@ -0,0 +1,180 @@
+import random
+from sqlalchemy import func
+from sqlalchemy.future import select
+from models import LeaderboardEntry
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # width[level] is the number of positions from this node to next[level]
+        # (or to the end of the list when next[level] is None).
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """Sorted list of unique keys with O(log n) insert, remove, rank and select."""
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key <= key:
+                pos += node.width[level]
+                node = node.next[level]
+            chain[level], positions[level] = node, pos
+        new = _Node(key, self._random_levels())
+        for level in range(len(new.next)):
+            prev = chain[level]
+            distance = pos + 1 - positions[level]
+            new.next[level] = prev.next[level]
+            new.width[level] = prev.width[level] - distance + 1
+            prev.next[level] = new
+            prev.width[level] = distance
+        for level in range(len(new.next), self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def count_less(self, key):
+        """Number of keys strictly smaller than ``key``."""
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+        return pos
+
+    def slice(self, start, stop):
+        """Keys at positions ``start`` (inclusive) to ``stop`` (exclusive)."""
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return []
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and pos + node.width[level] <= start + 1:
+                pos += node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return self.slice(index, index + 1)[0]
+
+
+class UserRanking:
+    """Best score per user, ordered for O(log n) rank lookups.
+
+    Users are kept in an indexable skip list keyed by ``(-best_score,
+    username)``. Ranks use competition ranking: users sharing a score share
+    a rank, and the next distinct score skips ahead accordingly.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._best = {}
+        self._order = IndexableSkipList()
+
+    def __len__(self):
+        return len(self._best)
+
+    async def warm(self, db):
+        result = await db.execute(
+            select(LeaderboardEntry.username, func.max(LeaderboardEntry.score))
+            .group_by(LeaderboardEntry.username)
+        )
+        best, order = {}, IndexableSkipList()
+        for username, score in result.all():
+            best[username] = score
+            order.insert((-score, username))
+        self._best, self._order = best, order
+        self.loaded = True
+
+    async def ensure_warm(self, db):
+        if not self.loaded:
+            await self.warm(db)
+
+    def add(self, username, score):
+        if not self.loaded:
+            return
+        previous = self._best.get(username)
+        if previous is not None:
+            if score <= previous:
+                return
+            self._order.remove((-previous, username))
+        self._best[username] = score
+        self._order.insert((-score, username))
+
+    def best_score(self, username):
+        return self._best.get(username)
+
+    def rank(self, username):
+        score = self._best.get(username)
+        if score is None:
+            return None
+        return self._order.count_less((-score,)) + 1
+
+    def around(self, username, window):
+        score = self._best.get(username)
+        if score is None:
+            return None
+        position = self._order.count_less((-score, username))
+        start = max(position - window, 0)
+        entries = []
+        rank = None
+        for offset, (neg_score, name) in enumerate(self._order.slice(start, position + window + 1)):
+            if rank is None:
+                rank = self._order.count_less((neg_score,)) + 1
+            elif -neg_score != entries[-1]["score"]:
+                rank = start + offset + 1
+            entries.append({"rank": rank, "username": name, "score": -neg_score})
+        return entries
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+
+class SessionStore(ABC):
+    """Maps session tokens to user ids. Tokens expire ``ttl`` seconds after login."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, token):
+        ...
+
+    @abstractmethod
+    async def set(self, token, user_id):
+        ...
+
+    @abstractmethod
+    async def delete(self, token):
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process store with TTL expiry and LRU eviction past ``max_entries``."""
+
+    def __init__(self, ttl=86400, max_entries=100_000):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return user_id
+
+    async def set(self, token, user_id):
+        self._entries[token] = (user_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, token):
+        self._entries.pop(token, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store shared by every worker process on one host through a WAL-mode SQLite file."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path="./sessions.db", ttl=86400):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "token TEXT PRIMARY KEY, user_id INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, token):
+        row = self._connection().execute(
+            "SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?", (token, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, token, user_id):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (token, user_id, expires_at) VALUES (?, ?, ?)",
+            (token, user_id, now + self.ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def _delete(self, token):
+        self._connection().execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    async def get(self, token):
+        return await asyncio.to_thread(self._get, token)
+
+    async def set(self, token, user_id):
+        await asyncio.to_thread(self._set, token, user_id)
+
+    async def delete(self, token):
+        await asyncio.to_thread(self._delete, token)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisSessionStore(SessionStore):
+    """Store shared across hosts, speaking the Redis protocol (RESP2) directly.
+
+    One connection is kept per event loop. Connecting and every request on it
+    are serialised by one lock, so each reply is read by the coroutine that
+    sent the command. A request that fails, times out after ``timeout``
+    seconds or is cancelled between sending and reading closes the
+    connection, so its unread reply can never be taken as the answer to the
+    next command.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", ttl=86400, prefix="session:", timeout=5.0):
+        super().__init__(ttl)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._conn = None
+        self._lock = None
+
+    def _loop_lock(self):
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock[0] is not loop:
+            self._lock = (loop, asyncio.Lock())
+        return self._lock[1]
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        if self._conn is not None and self._conn[0] is loop and not self._conn[2].is_closing():
+            return self._conn[1], self._conn[2]
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self._conn = (loop, reader, writer)
+        if self.password:
+            await self._command(reader, writer, ("AUTH", self.password))
+        if self.db:
+            await self._command(reader, writer, ("SELECT", self.db))
+        return reader, writer
+
+    def _disconnect(self):
+        conn, self._conn = self._conn, None
+        # A connection made on another loop can only be dropped, not closed, from this one
+        if conn is not None and conn[0] is asyncio.get_running_loop():
+            conn[2].close()
+
+    async def _command(self, reader, writer, args):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        writer.write(b"".join(payload))
+        await writer.drain()
+        return await self._read_reply(reader)
+
+    async def _execute(self, *args):
+        async with self._loop_lock():
+            try:
+                async with asyncio.timeout(self.timeout):
+                    reader, writer = await self._connect()
+                    return await self._command(reader, writer, args)
+            except BaseException:
+                self._disconnect()
+                raise
+
+    async def _read_reply(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise RedisError("connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            return [await self._read_reply(reader) for _ in range(int(body))]
+        raise RedisError(f"unexpected reply: {line!r}")
+
+    async def get(self, token):
+        value = await self._execute("GET", self.prefix + token)
+        return int(value) if value is not None else None
+
+    async def set(self, token, user_id):
+        await self._execute("SET", self.prefix + token, user_id, "EX", int(self.ttl))
+
+    async def delete(self, token):
+        await self._execute("DEL", self.prefix + token)
+
+    async def close(self):
+        if self._conn is not None:
+            writer = self._conn[2]
+            self._conn = None
+            writer.close()
+            await writer.wait_closed()
+
+
+def create_session_store():
+    backend = os.getenv("SESSION_BACKEND", "memory")
+    ttl = int(os.getenv("SESSION_TTL", "86400"))
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl, max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "100000")))
+    if backend == "sqlite":
+        return SQLiteSessionStore(path=os.getenv("SESSION_DB_PATH", "./sessions.db"), ttl=ttl)
+    if backend == "redis":
+        return RedisSessionStore(url=os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl,
+                                 timeout=float(os.getenv("REDIS_TIMEOUT", "5")))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
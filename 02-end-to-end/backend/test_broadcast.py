@@ -0,0 +1,49 @@
+import asyncio
+from broadcast import GameBroadcaster
+from db import SessionLocal
+from game_engine import GameEngine, SnakeSim
+
+
+def make_engine():
+    engine = GameEngine(SessionLocal)
+    engine.add(SnakeSim(1, "demo", "pass-through"))
+    broadcaster = GameBroadcaster(buffer_size=4)
+    engine.on_tick = broadcaster.on_tick
+    return engine, broadcaster
+
+
+def test_frames_are_encoded_once_per_tick():
+    async def run():
+        engine, broadcaster = make_engine()
+        subs = [broadcaster.subscribe(engine.get(1)) for _ in range(50)]
+        engine.tick()
+        assert broadcaster.frames_encoded == 1
+        first = [await sub.next_frame() for sub in subs]
+        second = [await sub.next_frame() for sub in subs]
+        assert all(frame.startswith(b"event: snapshot") for frame in first)
+        assert all(frame is second[0] for frame in second)
+        assert second[0].startswith(b"event: delta")
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_drops_frames_and_resyncs():
+    async def run():
+        engine, broadcaster = make_engine()
+        slow = broadcaster.subscribe(engine.get(1))
+        fast = broadcaster.subscribe(engine.get(1))
+        for _ in range(6):
+            engine.tick()
+            while fast.frames:
+                await fast.next_frame()
+        assert slow.dropped > 0
+        assert fast.dropped == 0
+        frames = [await slow.next_frame() for _ in range(len(slow.frames))]
+        assert frames[0].startswith(b"event: snapshot")
+        assert len(frames) <= slow.buffer_size
+        assert await slow.next_frame(timeout=0.01) is None
+        broadcaster.unsubscribe(slow)
+        broadcaster.unsubscribe(fast)
+        assert broadcaster.subscriber_count() == 0
+
+    asyncio.run(run())
@@ -0,0 +1,148 @@
+import asyncio
+from collections import deque
+from sqlalchemy.future import select
+from db import SessionLocal
+from models import Game
+from game_engine import GRID_SIZE, GameEngine, SnakeSim
+
+
+def without_food(sim):
+    # With no food on the board the snake keeps its direction
+    sim.board[sim.food] = 0
+    sim.food = -1
+    return sim
+
+
+def test_snake_moves_grows_and_hits_walls():
+    sim = SnakeSim(1, "demo", "walls", width=5, height=5)
+    sim.board[sim.food] = 0
+    head = sim.body[0]
+    sim.food = head + 1
+    sim.board[sim.food] = 2
+    sim.step()
+    assert sim.score == 1
+    assert list(sim.body) == [head + 1, head]
+    without_food(sim)
+    for _ in range(5):
+        sim.step()
+    assert not sim.alive
+
+
+def test_pass_through_wraps_around():
+    sim = without_food(SnakeSim(2, "demo", "pass-through", width=5, height=5))
+    for _ in range(5):
+        sim.step()
+    assert sim.alive
+    assert sim.ticks == 5
+    assert sim.body[0] == 12
+
+
+def test_encode_round_trip():
+    sim = SnakeSim(3, "demo", "walls")
+    for _ in range(40):
+        sim.step()
+    state = sim.encode()
+    restored = SnakeSim.decode(3, "demo", "walls", state)
+    assert restored.snapshot() == sim.snapshot()
+    assert restored.board == sim.board
+    assert SnakeSim.decode(3, "demo", "walls", "not a state") is None
+
+
+def test_decode_rejects_out_of_bounds_state():
+    def tampered(**fields):
+        sim = SnakeSim(3, "demo", "walls")
+        for name, value in fields.items():
+            setattr(sim, name, value)
+        return SnakeSim.decode(3, "demo", "walls", sim.encode())
+
+    cells = GRID_SIZE * GRID_SIZE
+    assert tampered(food=cells) is None
+    assert tampered(food=-2) is None
+    assert tampered(direction=4) is None
+    assert tampered(body=deque([cells])) is None
+    assert tampered(width=0) is None
+    assert tampered(height=1) is None  # the body no longer fits on the board
+    assert tampered(food=-1) is not None
+
+
+def test_engine_tick_survives_a_failing_game():
+    engine = GameEngine(SessionLocal)
+    broken, healthy = SnakeSim(1, "bot", "walls"), SnakeSim(2, "bot", "walls")
+    broken.body = None  # corrupted in memory
+    engine.add(broken)
+    engine.add(healthy)
+    engine.on_tick = lambda engine: 1 / 0
+    engine.tick()
+    assert engine.get(1) is None
+    assert healthy.ticks == 1
+
+
+def test_engine_evicts_least_recently_used_games():
+    async def run():
+        async with SessionLocal() as db:
+            games = [Game(username="evict", mode="walls", state="{}") for _ in range(3)]
+            db.add_all(games)
+            await db.commit()
+            engine = GameEngine(SessionLocal, max_games=2)
+            first, second, third = (engine.sim_from_row(game) for game in games)
+            engine.tick()
+            evicted = engine.get(games[0].id)
+            # Persisting still writes the evicted game's last state
+            await engine.persist()
+            result = await db.execute(select(Game.state).where(Game.id == games[0].id))
+            return first, evicted, engine, result.scalar_one()
+
+    first, evicted, engine, state = asyncio.run(run())
+    assert evicted is None
+    assert len(engine.games) == 2
+    assert first.ticks == 0 and not first.dirty
+    assert SnakeSim.decode(first.game_id, "evict", "walls", state).snapshot() == first.snapshot()
+
+
+def test_engine_steps_thousands_of_games_per_tick():
+    engine = GameEngine(SessionLocal)
+    for game_id in range(5000):
+        engine.add(SnakeSim(game_id, "bot", "pass-through"))
+    engine.tick()
+    assert all(sim.ticks == 1 for sim in engine.games.values())
+
+
+def test_engine_persists_state_to_games_table():
+    async def run():
+        async with SessionLocal() as db:
+            game = Game(username="engine", mode="walls", state="{}")
+            db.add(game)
+            await db.commit()
+            engine = GameEngine(SessionLocal)
+            await engine.load(db)
+            sim = engine.get(game.id)
+            for _ in range(3):
+                engine.tick()
+            await engine.persist()
+            result = await db.execute(select(Game.state).where(Game.id == game.id))
+            return sim, result.scalar_one()
+
+    sim, state = asyncio.run(run())
+    assert not sim.dirty
+    assert SnakeSim.decode(sim.game_id, "engine", "walls", state).snapshot() == sim.snapshot()
+
+
+def test_engine_never_overwrites_states_it_cannot_decode():
+    async def run():
+        async with SessionLocal() as db:
+            legacy = Game(username="legacy", mode="walls", state='{"snake": [[1, 2]]}')
+            blank = Game(username="blank", mode="walls", state="")
+            db.add_all([legacy, blank])
+            await db.commit()
+            engine = GameEngine(SessionLocal)
+            engine.sim_from_row(legacy)
+            engine.sim_from_row(blank)
+            engine.tick()
+            await engine.persist()
+            result = await db.execute(select(Game.id, Game.state).where(Game.id.in_([legacy.id, blank.id])))
+            return engine, legacy.id, blank.id, dict(result.all())
+
+    engine, legacy_id, blank_id, states = asyncio.run(run())
+    assert engine.get(legacy_id).ticks == 1
+    assert states[legacy_id] == '{"snake": [[1, 2]]}'
+    assert SnakeSim.decode(blank_id, "blank", "walls", states[blank_id]) is not None
@@ -50,3 +50,286 @@ def test_games():
         assert state["id"] == game_id
         assert "snake" in state
         assert "food" in state
+
+def test_leaderboard_top_k_matches_table():
+    for score in (5, 500, 7, 499):
+        r = client.post("/leaderboard", json={"username": "topk", "score": score})
+        assert r.json()["success"]
+    entries = client.get("/leaderboard").json()
+    assert len(entries) <= 10
+    scores = [e["score"] for e in entries]
+    assert scores == sorted(scores, reverse=True)
+    assert {"username": "topk", "score": 500} in entries
+    r = client.get("/leaderboard/consistency")
+    assert r.status_code == 200
+    assert r.json() == {"consistent": True, "problems": []}
+
+def test_score_ingest_batches_concurrent_submissions():
+    import asyncio
+    from db import SessionLocal
+    from ingest import ScoreIngestQueue
+
+    flushed = []
+
+    async def run():
+        queue = ScoreIngestQueue(SessionLocal, max_batch=100, max_delay=0.05, on_flush=flushed.extend)
+        await queue.start()
+        await asyncio.gather(*(queue.submit("batched", i) for i in range(50)))
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.rows_flushed == 50
+    assert queue.batches_flushed < 50
+    assert sorted(score for _, _, score in flushed) == list(range(50))
+
+def test_score_ingest_survives_failing_on_flush():
+    import asyncio
+    from db import SessionLocal
+    from ingest import ScoreIngestQueue
+
+    def fail(rows):
+        raise TypeError("boom")
+
+    async def run():
+        queue = ScoreIngestQueue(SessionLocal, max_delay=0.01, on_flush=fail)
+        await queue.start()
+        await asyncio.wait_for(queue.submit("flaky", 1), 5)
+        await asyncio.wait_for(queue.submit("flaky", 2), 5)
+        assert queue.running
+        await queue.stop()
+        return queue
+
+    assert asyncio.run(run()).rows_flushed == 2
+
+def test_submit_score_rejects_invalid_rows():
+    for body in ({"score": 5}, {"username": "", "score": 5}, {"username": "bad", "score": "5"},
+                 {"username": "bad", "score": 1.5}, {"username": "bad"}):
+        assert client.post("/leaderboard", json=body).status_code == 422
+    assert client.get("/leaderboard/rank/bad").status_code == 404
+
+def test_score_ingest_rejects_submissions_during_stop():
+    import asyncio
+    from db import SessionLocal
+    from ingest import IngestQueueClosed, ScoreIngestQueue
+
+    async def run():
+        queue = ScoreIngestQueue(SessionLocal, max_delay=0.05)
+        await queue.start()
+        queued = asyncio.create_task(queue.submit("stopping", 1))
+        await asyncio.sleep(0)
+        stopping = asyncio.create_task(queue.stop())
+        await asyncio.sleep(0)
+        assert not queue.accepts_from_current_loop()
+        try:
+            await queue.submit("stopping", 2)
+        except IngestQueueClosed:
+            rejected = True
+        else:
+            rejected = False
+        await asyncio.wait_for(queued, 5)
+        await asyncio.wait_for(stopping, 5)
+        return rejected, queue.rows_flushed
+
+    assert asyncio.run(run()) == (True, 1)
+
+def test_score_ingest_drains_on_shutdown():
+    with TestClient(app) as c:
+        for score in (1001, 1002):
+            r = c.post("/leaderboard", json={"username": "drained", "score": score})
+            assert r.json()["success"]
+    r = client.get("/leaderboard")
+    assert {"username": "drained", "score": 1002} in r.json()
+
+def test_rank_and_around():
+    for username, score in [("rank_a", 9001), ("rank_b", 9002), ("rank_a", 9003)]:
+        client.post("/leaderboard", json={"username": username, "score": score})
+    r = client.get("/leaderboard/rank/rank_a")
+    assert r.status_code == 200
+    assert r.json()["score"] == 9003
+    assert r.json()["rank"] == 1
+    r = client.get("/leaderboard/around/rank_b", params={"window": 1})
+    assert [e["username"] for e in r.json()][:2] == ["rank_a", "rank_b"]
+    assert client.get("/leaderboard/rank/no_such_user").status_code == 404
+
+def test_user_lookup_is_cached_until_logout():
+    client.post("/signup", json={"username": "cacheuser", "password": "pw"})
+    token = client.post("/login", json={"username": "cacheuser", "password": "pw"}).json()["token"]
+    before = client.get("/user/cache-stats").json()
+    for _ in range(3):
+        assert client.get("/user", headers={"Authorization": token}).json() == {"username": "cacheuser"}
+    after = client.get("/user/cache-stats").json()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 2
+    client.post("/logout", headers={"Authorization": token})
+    assert client.get("/user", headers={"Authorization": token}).status_code == 401
+
+def test_user_cache_invalidates_all_tokens_of_a_user():
+    from user_cache import UserCache
+    cache = UserCache()
+    cache.put("t1", 1, {"username": "a"})
+    cache.put("t2", 1, {"username": "a"})
+    cache.put("t3", 2, {"username": "b"})
+    assert cache.get("t1", 2) is None  # token now belongs to someone else
+    cache.invalidate_user(1)
+    assert cache.get("t2", 1) is None
+    assert cache.get("t3", 2) == {"username": "b"}
+    assert cache.stats()["hits"] == 1
+
+def test_game_state_comes_from_simulation():
+    import asyncio
+    from db import SessionLocal
+    from models import Game
+
+    async def create_game():
+        async with SessionLocal() as db:
+            game = Game(username="watched", mode="walls", state="")
+            db.add(game)
+            await db.commit()
+            return game.id
+
+    game_id = asyncio.run(create_game())
+    first = client.get(f"/games/{game_id}").json()
+    assert first == client.get(f"/games/{game_id}").json()
+    assert first["username"] == "watched"
+    assert all(0 <= seg["x"] < 15 and 0 <= seg["y"] < 15 for seg in first["snake"])
+    assert client.get("/games/999999").status_code == 404
+
+def test_games_listing_is_paginated_and_filterable():
+    import asyncio
+    from db import SessionLocal
+    from models import Game
+
+    async def create_games():
+        async with SessionLocal() as db:
+            games = [Game(username="pager", mode=("walls" if i % 2 else "pass-through"), state="x") for i in range(5)]
+            db.add_all(games)
+            await db.commit()
+            return [g.id for g in games]
+
+    ids = asyncio.run(create_games())
+    r = client.get("/games", params={"username": "pager", "limit": 2, "include_state": False})
+    page = r.json()
+    assert [g["id"] for g in page] == ids[:2]
+    assert "state" not in page[0]
+    r = client.get("/games", params={"username": "pager", "after": page[-1]["id"], "limit": 10})
+    assert [g["id"] for g in r.json()] == ids[2:]
+    assert r.json()[0]["state"] == "x"
+    r = client.get("/games", params={"username": "pager", "mode": "walls"})
+    assert [g["id"] for g in r.json()] == ids[1::2]
+    assert client.get("/games", params={"username": "nobody"}).json() == []
+
+def test_engines_apply_sqlite_pragmas():
+    import asyncio
+    import pytest
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from db import SessionLocal, ReadSessionLocal, DB_URL, is_sqlite, is_sqlite_memory
+
+    if not is_sqlite(DB_URL) or is_sqlite_memory(DB_URL):
+        pytest.skip("pragmas only apply to file-backed SQLite")
+
+    async def run():
+        async with SessionLocal() as db:
+            assert (await db.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await db.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+        async with ReadSessionLocal() as db:
+            with pytest.raises(OperationalError):
+                await db.execute(text("DELETE FROM games"))
+
+    asyncio.run(run())
+
+def test_passwords_are_hashed_and_legacy_rows_upgraded():
+    import asyncio
+    from sqlalchemy.future import select
+    from db import SessionLocal
+    from models import User
+
+    async def password_of(username):
+        async with SessionLocal() as db:
+            return (await db.execute(select(User.password).where(User.username == username))).scalar_one()
+
+    async def create_legacy_user():
+        async with SessionLocal() as db:
+            db.add(User(username="legacy", password="plain"))
+            await db.commit()
+
+    client.post("/signup", json={"username": "hashed", "password": "secret"})
+    assert asyncio.run(password_of("hashed")).startswith("scrypt$")
+    assert not client.post("/login", json={"username": "hashed", "password": "wrong"}).json()["success"]
+    assert client.post("/login", json={"username": "hashed", "password": "secret"}).json()["success"]
+
+    asyncio.run(create_legacy_user())
+    assert client.post("/login", json={"username": "legacy", "password": "plain"}).json()["success"]
+    assert asyncio.run(password_of("legacy")).startswith("scrypt$")
+    assert client.post("/login", json={"username": "legacy", "password": "plain"}).json()["success"]
+    assert not client.post("/login", json={"username": "legacy", "password": "scrypt"}).json()["success"]
+
+def test_password_hasher_flags_outdated_parameters():
+    from passwords import PasswordHasher
+    weak, strong = PasswordHasher(n=2 ** 10, workers=0), PasswordHasher(n=2 ** 11, workers=0)
+    stored = weak.hash_sync("pw")
+    assert strong.verify_sync(stored, "pw")
+    assert strong.needs_rehash(stored)
+    assert not weak.needs_rehash(stored)
+
+def test_login_for_unknown_user_still_runs_the_kdf(monkeypatch):
+    from main import password_hasher
+    calls = []
+    verify_sync = password_hasher.verify_sync
+    monkeypatch.setattr(password_hasher, "verify_sync", lambda stored, pw: calls.append(stored) or verify_sync(stored, pw))
+    r = client.post("/login", json={"username": "nobody-registered-this", "password": "guess"})
+    assert not r.json()["success"]
+    assert len(calls) == 1 and calls[0].startswith("scrypt$")
+
+def test_metrics_endpoint_reports_route_latency_and_db_time():
+    client.get("/leaderboard/consistency")
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/leaderboard/consistency"}' in body
+    assert 'http_requests_total{method="GET",route="/leaderboard/consistency",status="200"}' in body
+    db_line = next(line for line in body.splitlines()
+                   if line.startswith('http_request_db_seconds_total{method="GET",route="/leaderboard/consistency"}'))
+    assert float(db_line.split()[-1]) > 0
+    assert "user_cache_hits " in body
+
+def test_stack_sampler_dumps_folded_stacks(tmp_path):
+    import time
+    from metrics import StackSampler
+
+    sampler = StackSampler(str(tmp_path), hz=500)
+    sampler.start()
+
+    def busy_handler():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    start = time.perf_counter()
+    busy_handler()
+    path = sampler.dump(start, time.perf_counter(), "GET /slow")
+    sampler.stop()
+    lines = open(path).read().splitlines()
+    assert any("busy_handler (test_main.py" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+def test_stack_sampler_covers_threadpool_handlers(tmp_path):
+    import threading
+    import time
+    from metrics import StackSampler
+
+    sampler = StackSampler(str(tmp_path), hz=500)
+    sampler.start()
+
+    def sync_handler():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    start = time.perf_counter()
+    worker = threading.Thread(target=sync_handler, name="pool-worker")
+    worker.start()
+    worker.join()
+    path = sampler.dump(start, time.perf_counter(), "GET /sync")
+    sampler.stop()
+    lines = open(path).read().splitlines()
+    assert any(line.startswith("pool-worker;") and "sync_handler (test_main.py" in line for line in lines)
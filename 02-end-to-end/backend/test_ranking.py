@@ -0,0 +1,37 @@
+import random
+from ranking import IndexableSkipList, UserRanking
+
+
+def test_skiplist_matches_sorted_list():
+    rng = random.Random(7)
+    skiplist, reference = IndexableSkipList(), []
+    for _ in range(2000):
+        key = rng.randrange(500)
+        if key in reference and rng.random() < 0.5:
+            skiplist.remove(key)
+            reference.remove(key)
+        elif key not in reference:
+            skiplist.insert(key)
+            reference.append(key)
+            reference.sort()
+        probe = rng.randrange(500)
+        assert skiplist.count_less(probe) == sum(k < probe for k in reference)
+    assert list(skiplist) == reference
+    assert len(skiplist) == len(reference)
+    assert skiplist.slice(10, 20) == reference[10:20]
+    assert skiplist[-1] == reference[-1]
+
+
+def test_user_ranking_keeps_best_score_and_shares_ties():
+    ranking = UserRanking()
+    ranking.loaded = True
+    for username, score in [("a", 10), ("b", 30), ("c", 20), ("a", 5), ("d", 20), ("a", 40)]:
+        ranking.add(username, score)
+    assert ranking.best_score("a") == 40
+    assert [ranking.rank(u) for u in "abcd"] == [1, 2, 3, 3]
+    assert ranking.rank("nobody") is None
+    assert ranking.around("c", 1) == [
+        {"rank": 2, "username": "b", "score": 30},
+        {"rank": 3, "username": "c", "score": 20},
+        {"rank": 3, "username": "d", "score": 20},
+    ]
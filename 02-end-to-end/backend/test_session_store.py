@@ -0,0 +1,133 @@
+import asyncio
+import time
+from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore
+
+
+async def start_fake_redis(connections=None):
+    """Minimal RESP2 server understanding GET, SET (with EX), DEL and SELECT.
+
+    Replies about keys containing "slow" are delayed by half a second.
+    Accepted connections are counted in ``connections["count"]``.
+    """
+    data = {}
+
+    async def handle(reader, writer):
+        if connections is not None:
+            connections["count"] = connections.get("count", 0) + 1
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args = []
+            for _ in range(int(header[1:])):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode())
+            command = args[0].upper()
+            value = data.get(args[1]) if len(args) > 1 else None
+            if value is not None and value[1] is not None and value[1] <= time.monotonic():
+                del data[args[1]]
+                value = None
+            if command == "GET":
+                reply = b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value[0]), value[0].encode())
+            elif command == "SET":
+                ttl = int(args[4]) if len(args) > 4 and args[3].upper() == "EX" else None
+                data[args[1]] = (args[2], time.monotonic() + ttl if ttl else None)
+                reply = b"+OK\r\n"
+            elif command == "DEL":
+                reply = b":%d\r\n" % int(data.pop(args[1], None) is not None)
+            elif command == "SELECT":
+                reply = b"+OK\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+            if len(args) > 1 and "slow" in args[1]:
+                await asyncio.sleep(0.5)
+            writer.write(reply)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_memory_store_expires_and_evicts():
+    async def run():
+        store = MemorySessionStore(ttl=60, max_entries=2)
+        await store.set("a", 1)
+        await store.set("b", 2)
+        assert await store.get("a") == 1  # touch "a" so "b" is least recently used
+        await store.set("c", 3)
+        assert await store.get("b") is None
+        assert await store.get("a") == 1
+        assert len(store) == 2
+        store.ttl = 0
+        await store.set("d", 4)
+        assert await store.get("d") is None
+        await store.delete("a")
+        assert await store.get("a") is None
+
+    asyncio.run(run())
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    async def run():
+        path = str(tmp_path / "sessions.db")
+        first, second = SQLiteSessionStore(path, ttl=60), SQLiteSessionStore(path, ttl=60)
+        await first.set("token", 7)
+        assert await second.get("token") == 7
+        await second.delete("token")
+        assert await first.get("token") is None
+
+    asyncio.run(run())
+
+
+def test_redis_store_against_fake_server():
+    async def run():
+        server, port = await start_fake_redis()
+        async with server:
+            store = RedisSessionStore(f"redis://127.0.0.1:{port}/1", ttl=60)
+            assert await store.get("missing") is None
+            await store.set("token", 42)
+            assert await asyncio.gather(*(store.get("token") for _ in range(20))) == [42] * 20
+            await store.delete("token")
+            assert await store.get("token") is None
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_store_connects_once_for_concurrent_first_calls():
+    async def run():
+        connections = {}
+        server, port = await start_fake_redis(connections)
+        async with server:
+            store = RedisSessionStore(f"redis://127.0.0.1:{port}/1", ttl=60)
+            assert await asyncio.gather(*(store.get("token") for _ in range(10))) == [None] * 10
+            assert connections["count"] == 1
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_store_drops_connection_with_unread_reply():
+    async def run():
+        server, port = await start_fake_redis()
+        async with server:
+            store = RedisSessionStore(f"redis://127.0.0.1:{port}/0", ttl=60, timeout=0.2)
+            await store.set("alice", 1)
+            await store.set("bob", 2)
+            # Cancelled after sending GET, before its reply arrives
+            pending = asyncio.create_task(store.get("slow:alice"))
+            await asyncio.sleep(0.05)
+            pending.cancel()
+            assert await store.get("bob") == 2
+            # Timed out the same way
+            try:
+                await store.get("slow:bob")
+            except TimeoutError:
+                pass
+            else:
+                raise AssertionError("expected a timeout")
+            assert await store.get("alice") == 1
+            await store.close()
+
+    asyncio.run(run())
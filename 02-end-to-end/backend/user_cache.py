@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """Per-token cache of the profile returned by GET /user.
+
+    Entries remember the user id they were resolved for, so a token that the
+    session store now maps to a different user is treated as a miss. Entries
+    are dropped on logout (``invalidate_token``), whenever the user row
+    changes (``invalidate_user``), after ``ttl`` seconds, or in LRU order once
+    ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, ttl=300, max_entries=100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token, user_id):
+        entry = self._entries.get(token)
+        if entry is not None:
+            cached_user_id, profile, expires_at = entry
+            if cached_user_id == user_id and expires_at > time.monotonic():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return profile
+            self.invalidate_token(token)
+        self.misses += 1
+        return None
+
+    def put(self, token, user_id, profile):
+        self.invalidate_token(token)
+        self._entries[token] = (user_id, profile, time.monotonic() + self.ttl)
+        self._tokens_by_user.setdefault(user_id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self.invalidate_token(next(iter(self._entries)))
+
+    def invalidate_token(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0]]
+
+    def invalidate_user(self, user_id):
+        for token in self._tokens_by_user.pop(user_id, ()):
+            self._entries.pop(token, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,100 @@
+"""Benchmark full against incremental re-indexing of a docs archive.
+
+Writes a synthetic archive of markdown files, indexes it, then writes a
+second version in which a fraction of the files changed, some were deleted
+and some were added. The second version is indexed twice: from scratch with
+write_index and from the first index with update_index. Both indexes are
+checked to score every passage the same before the times are reported:
+
+    python bench_index.py --docs 20000 --changed 0.01
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import zipfile
+import numpy as np
+from docs_index import DocsIndex, update_index, write_index
+
+QUERIES = ["server tool", "client resource prompt", "w17 w250", "context", "w4999 demo"]
+
+
+def make_vocabulary(size):
+    return [f"w{i}" for i in range(size)] + ["server", "tool", "client", "resource", "prompt", "context", "demo"]
+
+
+def make_doc(rng, words):
+    lines = []
+    for section in range(rng.randint(1, 6)):
+        lines.append(f"## Section {section} {rng.choice(words)}")
+        lines += [" ".join(rng.choices(words, k=rng.randint(5, 40))) for _ in range(rng.randint(1, 20))]
+    return "\n".join(lines)
+
+
+def write_archive(path, docs):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in docs.items():
+            z.writestr(f"fastmcp-main/{name}", content)
+
+
+def passage_order(index):
+    return sorted(range(len(index)), key=lambda i: (index.filenames[i], int(index.spans[i][0])))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and incremental index rebuilds")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--changed", type=float, default=0.01, help="fraction of files modified")
+    parser.add_argument("--deleted", type=float, default=0.005, help="fraction of files removed")
+    parser.add_argument("--added", type=float, default=0.005, help="new files, as a fraction of --docs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = make_vocabulary(5000)
+    docs = {f"docs/page{i}.md{'x' if i % 5 == 0 else ''}": make_doc(rng, words) for i in range(args.docs)}
+    names = list(docs)
+    changed = dict.fromkeys(rng.sample(names, int(args.changed * args.docs)))
+    deleted = set(rng.sample([name for name in names if name not in changed], int(args.deleted * args.docs)))
+    updated = {name: make_doc(rng, words) if name in changed else content
+               for name, content in docs.items() if name not in deleted}
+    for i in range(int(args.added * args.docs)):
+        updated[f"docs/new/page{i}.md"] = make_doc(rng, words)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_zip, after_zip = os.path.join(tmp, "before.zip"), os.path.join(tmp, "after.zip")
+        write_archive(before_zip, docs)
+        write_archive(after_zip, updated)
+
+        _, initial = timed(write_index, before_zip, os.path.join(tmp, "before"), "before")
+        old = DocsIndex(os.path.join(tmp, "before"))
+        _, full = timed(write_index, after_zip, os.path.join(tmp, "full"), "after")
+        stats, incremental = timed(update_index, old, after_zip, os.path.join(tmp, "incremental"), "after")
+
+        from_scratch = DocsIndex(os.path.join(tmp, "full"))
+        derived = DocsIndex(os.path.join(tmp, "incremental"))
+        # Passage order differs between the two, so compare scores by (filename, offset)
+        order, by_name = passage_order(derived), passage_order(from_scratch)
+        if [derived.document(i)["content"] for i in order] != [from_scratch.document(i)["content"] for i in by_name]:
+            raise SystemExit("Incremental index has different passages than a full rebuild")
+        for query in QUERIES:
+            if not np.allclose(derived.scores(query)[order], from_scratch.scores(query)[by_name]):
+                raise SystemExit(f"Incremental index disagrees with a full rebuild for {query!r}")
+
+    print(f"{args.docs} documents: {stats['added']} added, {stats['changed']} changed, "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+    print(f"initial build     {initial:8.2f}s")
+    print(f"full rebuild      {full:8.2f}s")
+    print(f"incremental       {incremental:8.2f}s")
+    print(f"speedup           x{full / max(incremental, 1e-9):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark query throughput of the docs search backends.
+
+Indexes the passages of a synthetic archive twice, with minsearch (the
+previous search_index path) and with the stored BM25 index, then runs the
+same random queries through minsearch.Index.search, DocsIndex.search one at
+a time, and DocsIndex.search_batch:
+
+    python bench_search.py --docs 5000 --queries 2000 --batch 64
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from bench_index import make_doc, make_vocabulary, write_archive
+from docs_index import DocsIndex, write_index
+from docs_zip import get_md_files_from_zip
+from extract_md_files import build_index
+
+
+def qps(run, queries):
+    start = time.perf_counter()
+    run(queries)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare minsearch with the BM25 docs index")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--terms", type=int, default=3, help="terms per query")
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = make_vocabulary(5000)
+    queries = [" ".join(rng.choices(words, k=args.terms)) for _ in range(args.queries)]
+    k = args.num_results
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = os.path.join(tmp, "docs.zip")
+        write_archive(zip_path, {f"docs/page{i}.md": make_doc(rng, words) for i in range(args.docs)})
+        minsearch_index = build_index(get_md_files_from_zip(zip_path))
+        write_index(zip_path, os.path.join(tmp, "index"), "bench")
+        index = DocsIndex(os.path.join(tmp, "index"))
+
+        results = {
+            "minsearch": qps(lambda qs: [minsearch_index.search(q, num_results=k) for q in qs], queries),
+            "bm25": qps(lambda qs: [index.search(q, num_results=k) for q in qs], queries),
+            f"bm25 x{args.batch}": qps(
+                lambda qs: [index.search_batch(qs[i:i + args.batch], num_results=k)
+                            for i in range(0, len(qs), args.batch)],
+                queries,
+            ),
+        }
+
+    print(f"{len(index)} passages from {args.docs} documents, {args.queries} queries of {args.terms} terms")
+    for name, rate in results.items():
+        print(f"{name:14}{rate:>10.0f} queries/s  x{rate / results['minsearch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""On-disk search index over the markdown docs in a zip archive.
+
+The index is built once per archive and stored in a directory named after
+the archive's SHA-256, so later runs only memory-map the arrays instead of
+re-tokenizing the corpus. When the archive changes, the new index is derived
+from the previous one and only added or changed files are tokenized.
+
+Documents are the heading-delimited passages from ``docs_zip``, tokenized
+like ``minsearch.Index`` (scikit-learn's defaults). They are scored with
+BM25, using a term-document matrix whose weights are computed when the index
+is written, so a query is one sparse matrix product.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from docs_zip import iter_member_docs, markdown_members
+
+INDEX_DIR = ".docs_index"
+FORMAT_VERSION = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Passage fields that search results can be filtered on
+KEYWORD_FIELDS = ("filename", "heading")
+
+# scikit-learn's default token pattern, applied to lower-cased text
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _tokenize_docs(member_docs, vocabulary, contents, first_doc_id=0):
+    """Append ``(position, doc)`` pairs to the open ``contents`` file and return their postings.
+
+    New terms are added to ``vocabulary``. Returns the (term, doc, count)
+    postings as arrays, the keyword fields, the (start, end) span in its
+    file, byte length of content and member position of each doc.
+    """
+    term_ids, doc_ids, counts = array("i"), array("i"), array("i")
+    keywords = {field: [] for field in KEYWORD_FIELDS}
+    spans, lengths, positions = array("q"), array("q"), array("i")
+    for doc_id, (position, doc) in enumerate(member_docs, first_doc_id):
+        for term, count in Counter(tokenize(doc["content"])).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_ids.append(doc_id)
+            counts.append(count)
+        data = doc["content"].encode()
+        contents.write(data)
+        lengths.append(len(data))
+        for field in KEYWORD_FIELDS:
+            keywords[field].append(doc[field])
+        spans.extend((doc["start"], doc["end"]))
+        positions.append(position)
+    postings = tuple(np.frombuffer(a, dtype=np.int32) for a in (term_ids, doc_ids, counts))
+    return (postings, keywords, np.frombuffer(spans, dtype=np.int64).reshape(-1, 2),
+            np.frombuffer(lengths, dtype=np.int64), np.frombuffer(positions, dtype=np.int32))
+
+
+def _save(path, vocabulary, postings, keywords, spans, lengths, members, doc_members, source_hash):
+    """Write everything except contents.bin, which the caller has already written."""
+    term_ids, doc_ids, counts = postings
+    num_docs = len(lengths)
+    terms = np.array(list(vocabulary), dtype=object)
+    # Drop terms that no longer occur in any document, e.g. after deletions
+    df = np.bincount(term_ids, minlength=len(terms))
+    used = df > 0
+    term_ids = (np.cumsum(used) - 1)[term_ids]
+    terms, df = terms[used], df[used]
+
+    # Postings are term-major: each term's (doc, count) pairs are one contiguous
+    # slice, in document order because the sort is stable
+    order = np.argsort(term_ids, kind="stable")
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+    postings_docs = doc_ids[order]
+    postings_counts = counts[order]
+
+    # BM25 weight of every posting; the postings arrays double as a CSR term-document matrix
+    doc_tokens = np.bincount(postings_docs, weights=postings_counts, minlength=num_docs)
+    avg_tokens = max(doc_tokens.mean(), 1.0) if num_docs else 1.0
+    tf = postings_counts.astype(np.float64)
+    saturation = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_tokens[postings_docs] / avg_tokens)
+    weights = (np.repeat(_idf(df, num_docs), df) * tf * (BM25_K1 + 1) / saturation).astype(np.float32)
+
+    offsets = np.zeros(num_docs + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(path, "indptr.npy"), indptr)
+    np.save(os.path.join(path, "postings_docs.npy"), postings_docs)
+    np.save(os.path.join(path, "postings_counts.npy"), postings_counts)
+    np.save(os.path.join(path, "weights.npy"), weights)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "spans.npy"), spans)
+    np.save(os.path.join(path, "doc_members.npy"), np.asarray(doc_members, dtype=np.int32))
+    _write_json(os.path.join(path, "terms.json"), terms.tolist())
+    _write_json(os.path.join(path, "keywords.json"), keywords)
+    _write_json(os.path.join(path, "members.json"),
+                [[info.filename, info.CRC, info.file_size] for info in members])
+    # Written last: an index directory without meta.json is incomplete
+    _write_json(os.path.join(path, "meta.json"), {
+        "version": FORMAT_VERSION,
+        "source_hash": source_hash,
+        "num_docs": num_docs,
+        "num_terms": len(terms),
+    })
+
+
+def write_index(zip_path, path, source_hash, workers=None):
+    """Index every markdown file of ``zip_path`` into a new directory ``path``.
+
+    Documents are streamed from the archive (see ``docs_zip.iter_member_docs``)
+    and their contents straight to disk; only the postings are held in
+    memory until they are sorted by term and written out.
+    """
+    os.makedirs(path)
+    members = markdown_members(zip_path)
+    vocabulary = {}
+    with open(os.path.join(path, "contents.bin"), "wb") as contents:
+        postings, keywords, spans, lengths, doc_members = _tokenize_docs(
+            iter_member_docs(zip_path, members, workers), vocabulary, contents
+        )
+    _save(path, vocabulary, postings, keywords, spans, lengths, members, doc_members, source_hash)
+    return {"added": len(members), "changed": 0, "deleted": 0, "unchanged": 0}
+
+
+def update_index(old, zip_path, path, source_hash, workers=None):
+    """Index ``zip_path`` into ``path``, reusing the unchanged documents of ``old``.
+
+    Members are compared by name, CRC and size. Only added and changed
+    files are read and tokenized. The postings and contents of unchanged
+    ones are copied over, and document frequencies and BM25 weights are
+    recomputed from them, so the cost follows the size of the change rather than of the
+    corpus.
+    """
+    os.makedirs(path)
+    members = markdown_members(zip_path)
+    previous = {name: (crc, size) for name, crc, size in old.members}
+    unchanged = {info.filename for info in members if previous.get(info.filename) == (info.CRC, info.file_size)}
+    stale = [info for info in members if info.filename not in unchanged]
+    member_ids = {info.filename: i for i, info in enumerate(members)}
+
+    old_names = [name for name, _, _ in old.members]
+    kept = np.fromiter((old_names[m] in unchanged for m in old.doc_members), dtype=bool, count=len(old))
+    kept_ids = np.flatnonzero(kept)
+    kept_members = [member_ids[old_names[old.doc_members[doc_id]]] for doc_id in kept_ids]
+
+    # Postings of kept documents, renumbered to close the gaps of dropped ones
+    old_terms = np.repeat(np.arange(len(old.indptr) - 1, dtype=np.int32), np.diff(old.indptr))
+    keep = kept[old.postings_docs]
+    new_doc_ids = (np.cumsum(kept) - 1).astype(np.int32)
+    vocabulary = dict(old.vocabulary)
+    with open(os.path.join(path, "contents.bin"), "wb") as contents:
+        for doc_id in kept_ids:
+            contents.write(old.content_bytes(doc_id))
+        added, keywords, spans, lengths, stale_positions = _tokenize_docs(
+            iter_member_docs(zip_path, stale, workers), vocabulary, contents, first_doc_id=len(kept_ids)
+        )
+    postings = (
+        np.concatenate([old_terms[keep], added[0]]),
+        np.concatenate([new_doc_ids[old.postings_docs[keep]], added[1]]),
+        np.concatenate([old.postings_counts[keep], added[2]]),
+    )
+    keywords = {field: [old.keywords[field][doc_id] for doc_id in kept_ids] + keywords[field]
+                for field in KEYWORD_FIELDS}
+    spans = np.concatenate([old.spans[kept_ids], spans])
+    lengths = np.concatenate([np.diff(old.offsets)[kept_ids], lengths])
+    doc_members = kept_members + [member_ids[stale[i].filename] for i in stale_positions]
+    _save(path, vocabulary, postings, keywords, spans, lengths, members, doc_members, source_hash)
+    return {
+        "added": sum(info.filename not in previous for info in stale),
+        "changed": sum(info.filename in previous for info in stale),
+        "deleted": len(previous.keys() - member_ids.keys()),
+        "unchanged": len(unchanged),
+    }
+
+
+def _idf(df, num_docs):
+    # BM25 IDF in the always-positive form used by Lucene
+    return np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+
+
+def _write_json(path, value):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class DocsIndex:
+    """A stored index, opened with its arrays and contents memory-mapped.
+
+    ``search`` has the same signature as ``minsearch.Index.search`` and
+    returns passages: dicts with 'filename', 'heading', 'start', 'end' and
+    'content'. ``search_batch`` scores many queries with one matrix product.
+    The index is read-only, so concurrent searches need no locking.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = _read_json(os.path.join(path, "meta.json"))
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {path}")
+        self.vocabulary = {term: i for i, term in enumerate(_read_json(os.path.join(path, "terms.json")))}
+        self.keywords = _read_json(os.path.join(path, "keywords.json"))
+        self.filenames = self.keywords["filename"]
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.indptr = load("indptr.npy")
+        self.postings_docs = load("postings_docs.npy")
+        self.postings_counts = load("postings_counts.npy")
+        self.weights = load("weights.npy")
+        self.offsets = load("offsets.npy")
+        self.spans = load("spans.npy")
+        # The archive member each document came from, for incremental updates
+        self.members = _read_json(os.path.join(path, "members.json"))
+        self.doc_members = load("doc_members.npy")
+        # Terms x documents; scipy keeps the memory-mapped data and indices as they are
+        self.matrix = csr_matrix((self.weights, self.postings_docs, self.indptr),
+                                 shape=(len(self.vocabulary), len(self.filenames)))
+        self._contents = None
+        if self.offsets[-1]:
+            with open(os.path.join(path, "contents.bin"), "rb") as f:
+                self._contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def content_bytes(self, doc_id):
+        start, end = self.offsets[doc_id], self.offsets[doc_id + 1]
+        return self._contents[start:end] if end > start else b""
+
+    def document(self, doc_id):
+        start, end = self.spans[doc_id]
+        return {
+            "filename": self.filenames[doc_id],
+            "heading": self.keywords["heading"][doc_id],
+            "start": int(start),
+            "end": int(end),
+            "content": self.content_bytes(doc_id).decode(),
+        }
+
+    def _query_matrix(self, queries):
+        """Queries x terms, weighted by how often each term occurs in the query."""
+        indptr, term_ids, counts = [0], [], []
+        for query in queries:
+            for term, count in Counter(tokenize(query)).items():
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    term_ids.append(term_id)
+                    counts.append(count)
+            indptr.append(len(term_ids))
+        return csr_matrix((np.asarray(counts, dtype=np.float32), term_ids, indptr),
+                          shape=(len(queries), len(self.vocabulary)))
+
+    def scores(self, query):
+        """BM25 score of ``query`` for every passage, as a dense array."""
+        return (self._query_matrix([query]) @ self.matrix).toarray().ravel()
+
+    def _allowed(self, filter_dict):
+        allowed = None
+        for field, value in (filter_dict or {}).items():
+            if field not in KEYWORD_FIELDS:
+                raise ValueError(f"Cannot filter on {field!r}")
+            values = {value} if isinstance(value, str) else set(value)
+            mask = np.fromiter((v in values for v in self.keywords[field]), dtype=bool, count=len(self))
+            allowed = mask if allowed is None else allowed & mask
+        return allowed
+
+    def search_batch(self, queries, filter_dict=None, num_results=10):
+        """``search`` for each of ``queries``, scored together in one sparse product.
+
+        Only the passages that share a term with a query are ranked, and the
+        top ``num_results`` are selected with ``argpartition`` before being
+        sorted.
+        """
+        hits = self._query_matrix(queries) @ self.matrix
+        allowed = self._allowed(filter_dict)
+        results = []
+        for row in range(len(queries)):
+            start, end = hits.indptr[row], hits.indptr[row + 1]
+            doc_ids, scores = hits.indices[start:end], hits.data[start:end]
+            if allowed is not None:
+                keep = allowed[doc_ids]
+                doc_ids, scores = doc_ids[keep], scores[keep]
+            if len(scores) > num_results:
+                top = np.argpartition(-scores, num_results - 1)[:num_results]
+                doc_ids, scores = doc_ids[top], scores[top]
+            # Best first, ties in document order
+            ranked = doc_ids[np.lexsort((doc_ids, -scores))][:num_results]
+            results.append([self.document(doc_id) for doc_id in ranked])
+        return results
+
+    def search(self, query, filter_dict=None, num_results=10):
+        """Top ``num_results`` passages for ``query``, best first.
+
+        ``filter_dict`` restricts results by keyword fields, e.g.
+        ``{"filename": name}`` or ``{"heading": [heading, ...]}``.
+        """
+        return self.search_batch([query], filter_dict, num_results)[0]
+
+
+def open_index(zip_path, index_dir=INDEX_DIR, workers=None):
+    """Open the stored index for ``zip_path``, building it first if needed.
+
+    A missing index is derived from the index of a previous archive version
+    when there is one (see ``update_index``) and built from scratch
+    otherwise. Indexes of other archive versions are removed afterwards.
+    """
+    source_hash = file_hash(zip_path)
+    path = os.path.join(index_dir, source_hash)
+    try:
+        return DocsIndex(path)
+    except (OSError, ValueError):
+        pass
+    os.makedirs(index_dir, exist_ok=True)
+    previous = _latest_index(index_dir)
+    # Build next to the final location and rename, so a crash never leaves a half-written index
+    staging = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+    try:
+        if previous is None:
+            write_index(zip_path, os.path.join(staging, "index"), source_hash, workers)
+        else:
+            update_index(previous, zip_path, os.path.join(staging, "index"), source_hash, workers)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(os.path.join(staging, "index"), path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    for name in os.listdir(index_dir):
+        if name != source_hash and not name.startswith(".build-"):
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+    return DocsIndex(path)
+
+
+def _latest_index(index_dir):
+    """The most recently written readable index in ``index_dir``, if any."""
+    paths = [os.path.join(index_dir, name) for name in os.listdir(index_dir) if not name.startswith(".build-")]
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            return DocsIndex(path)
+        except (OSError, ValueError):
+            continue
+    return None
@@ -0,0 +1,206 @@
+"""Streaming extraction of markdown passages from a docs zip archive.
+
+Files are split into passages at headings and size limits and yielded one
+at a time, so memory stays flat however large the archive or its files are.
+Large archives can have decompression and decoding fanned out to a process
+pool.
+"""
+import io
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+MARKDOWN_SUFFIXES = (".md", ".mdx")
+# Passages longer than this are split at line boundaries
+MAX_PASSAGE_CHARS = 4000
+# Members larger than this are streamed by the calling process rather than a worker
+MAX_WORKER_MEMBER_BYTES = 8 * 1024 * 1024
+# Archives with less uncompressed markdown than this are read serially
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+BATCH_BYTES = 4 * 1024 * 1024
+
+
+def markdown_members(zip_path):
+    """The ``ZipInfo`` of every markdown file in the archive, in archive order."""
+    with zipfile.ZipFile(zip_path) as z:
+        return [info for info in z.infolist() if info.filename.endswith(MARKDOWN_SUFFIXES)]
+
+
+def doc_filename(member_name):
+    """The member's path without the archive's top-level directory."""
+    parts = member_name.split("/", 1)
+    return parts[1] if len(parts) == 2 else member_name
+
+
+_HEADING = re.compile(r" {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$")
+_FENCE = re.compile(r" {0,3}(`{3,}|~{3,})")
+
+
+def _passage(heading, start, parts):
+    content = "".join(parts)
+    return {"heading": heading, "start": start, "end": start + len(content), "content": content}
+
+
+def split_passages(lines, max_chars=MAX_PASSAGE_CHARS):
+    """Split markdown ``lines`` (with their line endings) into passages.
+
+    A passage starts at every ATX heading (``#`` lines outside fenced code)
+    that follows some text. Passages are at most ``max_chars`` long, split
+    at line boundaries where possible. Yields
+    dicts with the passage ``content``, its ``heading`` path such as
+    "Servers > Running > Options", and its ``start`` and ``end`` character
+    offsets in the file.
+    """
+    path = []  # (level, title) of the headings enclosing the current line
+    heading, fence = "", None
+    parts, size, start, has_text = [], 0, 0, False
+    for line in lines:
+        text = line.rstrip("\r\n")
+        match = None
+        if fence is None:
+            opening = _FENCE.match(text)
+            if opening:
+                fence = opening.group(1)
+            else:
+                match = _HEADING.match(text)
+        else:
+            closing = _FENCE.match(text)
+            if (closing and closing.group(1)[0] == fence[0] and len(closing.group(1)) >= len(fence)
+                    and not text[closing.end():].strip()):
+                fence = None
+        if match and has_text:
+            yield _passage(heading, start, parts)
+            start += size
+            parts, size, has_text = [], 0, False
+        while size + len(line) > max_chars:
+            # End the passage before the line if it has text, otherwise fill it with the line's start
+            if not has_text and size < max_chars:
+                cut = max_chars - size
+                parts.append(line[:cut])
+                size += cut
+                line = line[cut:]
+            yield _passage(heading, start, parts)
+            start += size
+            parts, size, has_text = [], 0, False
+        if match:
+            level = len(match.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, match.group(2) or ""))
+            # Headings with no text in between collapse into the passage of the last one
+            heading = " > ".join(title for _, title in path)
+        elif text.strip():
+            has_text = True
+        parts.append(line)
+        size += len(line)
+    if parts:
+        yield _passage(heading, start, parts)
+
+
+def _member_passages(z, info, max_chars):
+    with z.open(info) as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8", errors="ignore", newline="")
+        yield from split_passages(text, max_chars)
+
+
+def _read_members(z, members, max_chars):
+    for position, info in members:
+        filename = doc_filename(info.filename)
+        passages = 0
+        for passage in _member_passages(z, info, max_chars):
+            passages += 1
+            yield position, {"filename": filename, **passage}
+        if not passages:
+            yield position, {"filename": filename, "heading": "", "start": 0, "end": 0, "content": ""}
+
+
+_worker_zip = None
+
+
+def _read_batch(zip_path, batch, max_chars):
+    # Each worker keeps its own handle on the archive between batches
+    global _worker_zip
+    if _worker_zip is None or _worker_zip.filename != zip_path:
+        _worker_zip = zipfile.ZipFile(zip_path)
+    return list(_read_members(_worker_zip, batch, max_chars))
+
+
+def _units(members, batch_bytes):
+    """Group ``(position, info)`` pairs, in order, into worker batches and members to stream."""
+    batch, size = [], 0
+    for item in members:
+        if item[1].file_size > MAX_WORKER_MEMBER_BYTES:
+            if batch:
+                yield "batch", batch
+                batch, size = [], 0
+            yield "stream", item
+            continue
+        batch.append(item)
+        size += item[1].file_size
+        if size >= batch_bytes:
+            yield "batch", batch
+            batch, size = [], 0
+    if batch:
+        yield "batch", batch
+
+
+def iter_member_docs(zip_path, members=None, workers=None, max_chars=MAX_PASSAGE_CHARS):
+    """Yield ``(position, doc)`` for the markdown ``members`` of ``zip_path``, in order.
+
+    ``members`` defaults to ``markdown_members(zip_path)``, and ``position``
+    is the index of the doc's member in it. A member yields one doc per
+    passage (see ``split_passages``) with its 'filename' added, and an empty
+    member yields one empty doc.
+
+    ``workers`` processes decompress and decode batches of members, with at
+    most two batches per worker in flight. It defaults to the CPU count for
+    archives with at least ``PARALLEL_MIN_BYTES`` of markdown and to 0
+    otherwise; 0 or 1 reads serially in the calling process. Members over
+    ``MAX_WORKER_MEMBER_BYTES`` are always streamed by the calling process.
+    """
+    if members is None:
+        members = markdown_members(zip_path)
+    members = list(enumerate(members))
+    if workers is None:
+        total = sum(info.file_size for _, info in members)
+        workers = (os.cpu_count() or 1) if total >= PARALLEL_MIN_BYTES else 0
+    with zipfile.ZipFile(zip_path) as z:
+        if workers <= 1:
+            yield from _read_members(z, members, max_chars)
+            return
+        pool = ProcessPoolExecutor(workers)
+        try:
+            window, in_flight = deque(), 0
+            units = _units(members, BATCH_BYTES)
+            while True:
+                # Submit ahead until the in-flight limit, keeping archive order in the window
+                for kind, unit in units:
+                    if kind == "batch":
+                        unit = pool.submit(_read_batch, zip_path, unit, max_chars)
+                        in_flight += 1
+                    window.append((kind, unit))
+                    if in_flight >= 2 * workers:
+                        break
+                if not window:
+                    return
+                kind, unit = window.popleft()
+                if kind == "batch":
+                    in_flight -= 1
+                    yield from unit.result()
+                else:
+                    yield from _read_members(z, [unit], max_chars)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def iter_md_files(zip_path, workers=None, max_chars=MAX_PASSAGE_CHARS):
+    """Yield the markdown passages of ``zip_path`` lazily; see ``iter_member_docs``."""
+    for _, doc in iter_member_docs(zip_path, workers=workers, max_chars=max_chars):
+        yield doc
+
+
+def get_md_files_from_zip(zip_path):
+    """All markdown passages of ``zip_path`` as a list, for ``minsearch.Index.fit``."""
+    return list(iter_md_files(zip_path))
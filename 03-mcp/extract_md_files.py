@@ -5,29 +5,17 @@ def search_index(index, query, num_results=5):
     """
     results = index.search(query, num_results=num_results)
     return results
-import zipfile
 import os
-from minsearch import Index
+from docs_index import open_index
 
 ZIP_NAME = "fastmcp-main.zip"
 
-def get_md_files_from_zip(zip_path):
-    md_files = []
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        for info in z.infolist():
-            if info.filename.endswith(('.md', '.mdx')):
-                # Remove the first part of the path (before the first slash)
-                filename = info.filename
-                if '/' in filename:
-                    filename = filename.split('/', 1)[1]
-                with z.open(info) as f:
-                    content = f.read().decode(errors='ignore')
-                md_files.append({"filename": filename, "content": content})
-    return md_files
-
+# The minsearch baseline for bench_search.py; the server itself searches with open_index
 def build_index(md_files):
-    # Use Index with text_fields=["content"], keyword_fields=["filename"]
-    index = Index(text_fields=["content"], keyword_fields=["filename"])
+    from minsearch import Index
+
+    # Passages are indexed by content; filename and heading are exact-match filters
+    index = Index(text_fields=["content"], keyword_fields=["filename", "heading"], numeric_fields=["start", "end"])
     index.fit(md_files)
     return index
 
@@ -35,10 +23,8 @@ if __name__ == "__main__":
     if not os.path.exists(ZIP_NAME):
         print(f"{ZIP_NAME} not found. Please download it first.")
     else:
-        md_files = get_md_files_from_zip(ZIP_NAME)
-        print(f"Found {len(md_files)} markdown files.")
-        index = build_index(md_files)
-        print(f"Indexed {len(md_files)} documents with minsearch.")
+        index = open_index(ZIP_NAME)
+        print(f"Loaded index of {len(index)} markdown passages.")
 
         # Example usage: search for a query if provided as argument
         import sys
@@ -47,6 +33,6 @@ if __name__ == "__main__":
             results = search_index(index, query)
             print(f"Top {len(results)} results for query: '{query}'\n")
             for i, doc in enumerate(results, 1):
-                print(f"Result {i}: {doc['filename']}")
+                print(f"Result {i}: {doc['filename']} > {doc['heading']}")
                 print(doc['content'][:300].replace('\n', ' '))
                 print("-"*40)
@@ -1,5 +1,10 @@
+import contextlib
+import sys
+from functools import cache
 from fastmcp import FastMCP
 import requests
+from docs_index import open_index
+from search import ZIP_NAME, download_zip, search_index
 
 mcp = FastMCP("Demo 🚀")
 
@@ -26,5 +31,19 @@ def count_word_data(url: str) -> int:
     content = response.text.lower()
     return content.count("data")
 
+
+@cache
+def docs_index():
+    # stdout carries the MCP protocol, so download progress goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        download_zip()
+    return open_index(ZIP_NAME)
+
+
+@mcp.tool
+def search_docs(query: str, num_results: int = 5) -> list[dict]:
+    """Search the FastMCP documentation. Returns the best-matching passages with their file, heading path and character offsets."""
+    return search_index(docs_index(), query, k=num_results)
+
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import threading
+import numpy as np
+from skills import parse_skills
+
+DIMENSIONS = ("type", "complexity", "client", "skill")
+PERCENTILES = (25, 50, 75, 90)
+
+
+class _Rollup:
+    """Deal values of one dimension as parallel (group code, value) arrays.
+
+    Counts and totals per group are updated in O(1) on every insert. The
+    percentiles need the full distribution, so ``summary()`` recomputes them
+    for all groups at once with one sort and is then cached until the next
+    insert.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self._code_of = {}
+        self._codes = np.empty(1024, dtype=np.int32)
+        self._values = np.empty(1024, dtype=np.float64)
+        self._size = 0
+        self._counts = []
+        self._totals = []
+        self._summary = None
+
+    def load(self, labels, values):
+        """Replace the contents with ``labels[i]`` / ``values[i]`` pairs, vectorized."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            uniques, codes = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+        else:
+            uniques, codes = [], np.empty(0, dtype=np.int32)
+        self.labels = list(uniques)
+        self._code_of = {label: code for code, label in enumerate(self.labels)}
+        capacity = max(1024, 2 * len(values))
+        self._codes = np.empty(capacity, dtype=np.int32)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self._codes[:len(values)] = codes
+        self._values[:len(values)] = values
+        self._size = len(values)
+        self._counts = np.bincount(codes, minlength=len(self.labels)).tolist()
+        self._totals = np.bincount(codes, weights=values, minlength=len(self.labels)).tolist()
+        self._summary = None
+
+    def add(self, label, value):
+        code = self._code_of.get(label)
+        if code is None:
+            code = self._code_of[label] = len(self.labels)
+            self.labels.append(label)
+            self._counts.append(0)
+            self._totals.append(0.0)
+        if self._size == len(self._values):
+            self._codes = np.resize(self._codes, 2 * self._size)
+            self._values = np.resize(self._values, 2 * self._size)
+        self._codes[self._size] = code
+        self._values[self._size] = value
+        self._size += 1
+        self._counts[code] += 1
+        self._totals[code] += value
+        self._summary = None
+
+    def summary(self):
+        if self._summary is None:
+            self._summary = self._compute()
+        return self._summary
+
+    def _compute(self):
+        if not self._size:
+            return []
+        codes, values = self._codes[:self._size], self._values[:self._size]
+        # Sort by group, then value: each group becomes a sorted, contiguous slice
+        sorted_values = values[np.lexsort((values, codes))]
+        counts = np.asarray(self._counts)
+        starts = np.cumsum(counts) - counts
+        totals = np.asarray(self._totals)
+        percentiles = {}
+        for pct in PERCENTILES:
+            # Linear interpolation between closest ranks, as np.percentile does
+            position = starts + (counts - 1) * (pct / 100)
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            weight = position - low
+            percentiles[pct] = sorted_values[low] * (1 - weight) + sorted_values[high] * weight
+        groups = []
+        for code in np.argsort(-totals, kind="stable"):
+            group = {
+                "key": self.labels[code],
+                "count": int(counts[code]),
+                "total_deal_value": float(totals[code]),
+                "mean_deal_value": float(totals[code] / counts[code]),
+            }
+            for pct in PERCENTILES:
+                group[f"p{pct}_deal_value"] = float(percentiles[pct][code])
+            groups.append(group)
+        return groups
+
+
+class Analytics:
+    """Deal-value rollups over opportunities, grouped by type, complexity, client and skill.
+
+    ``warm()`` builds every rollup from the table in one vectorized pass, and
+    ``add()`` keeps them current as opportunities are inserted. An opportunity
+    counts towards each of its skills with its full deal value. Repeated reads
+    between inserts are served from the cached summary.
+
+    Rollups are per process. With several workers each one sees the rows it
+    inserted itself plus whatever was in the table when it was warmed.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._rollups = {dimension: _Rollup() for dimension in DIMENSIONS + ("all",)}
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    def warm(self, db):
+        with self._lock, db.read() as conn:
+            rows = conn.execute(
+                "SELECT id, type, complexity, client, skills, deal_value FROM opportunities"
+            ).fetchall()
+            values = [row["deal_value"] for row in rows]
+            for dimension in ("type", "complexity", "client"):
+                self._rollups[dimension].load([row[dimension] for row in rows], values)
+            self._rollups["all"].load(["all"] * len(rows), values)
+            skill_labels, skill_values = [], []
+            for row in rows:
+                for skill in parse_skills(row["skills"]):
+                    skill_labels.append(skill)
+                    skill_values.append(row["deal_value"])
+            self._rollups["skill"].load(skill_labels, skill_values)
+            self._max_id = max((row["id"] for row in rows), default=0)
+            self.loaded = True
+
+    def ensure_warm(self, db):
+        if not self.loaded:
+            self.warm(db)
+
+    def add(self, opportunity_id, opportunity):
+        """Count a newly committed opportunity (a dict with the table's columns)."""
+        with self._lock:
+            # Before warm() the row will be read from the table; rows up to
+            # _max_id were already in the table when it was read.
+            if not self.loaded or opportunity_id <= self._max_id:
+                return
+            value = float(opportunity["deal_value"])
+            for dimension in ("type", "complexity", "client"):
+                # The columns are TEXT, so warm() sees a numeric client 5 as "5"
+                self._rollups[dimension].add(str(opportunity[dimension]), value)
+            self._rollups["all"].add("all", value)
+            for skill in parse_skills(opportunity["skills"]):
+                self._rollups["skill"].add(skill, value)
+
+    def summary(self, dimension):
+        with self._lock:
+            overall = self._rollups["all"].summary()
+            return {
+                "group_by": dimension,
+                "overall": {k: v for k, v in overall[0].items() if k != "key"} if overall else None,
+                "groups": self._rollups[dimension].summary(),
+            }
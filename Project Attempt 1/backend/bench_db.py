@@ -0,0 +1,120 @@
+"""Benchmark opportunity storage under mixed reads and writes.
+
+Runs the same workload twice against a scratch database. The first run uses
+the old access pattern: a new sqlite3 connection per operation with the
+default rollback journal. The second uses Database, with per-thread
+connections, WAL and cached statements.
+
+Each client thread loops over one opportunity insert and several reads of
+the latest 10 rows (the /view_opportunity query), then throughput is
+reported for both runs:
+
+    python bench_db.py --clients 16 --duration 5
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from db import Database
+from db_init import init_db
+
+INSERT = (
+    "INSERT INTO opportunities (title, client, contact_name, contact_email, description, type, complexity,"
+    " duration, skills, deal_value, insights) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+LATEST = "SELECT * FROM opportunities ORDER BY id DESC LIMIT 10"
+
+
+def row(n, i):
+    return (f"Opportunity {i}", f"client{n}", "Sam", "sam@example.com", "Benchmark row", "Consulting", "Medium",
+            "1 month", "python, sql", 1000.0 + i, '{"recommendations": "follow up"}')
+
+
+def connect_per_call(path):
+    """The old pattern: connect, run, commit and close for every operation."""
+
+    def write(params):
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute(INSERT, params)
+        conn.close()
+
+    def read():
+        conn = sqlite3.connect(path)
+        conn.execute(LATEST).fetchall()
+        conn.close()
+
+    return write, read, lambda: None
+
+
+def pooled(path):
+    db = Database(path)
+
+    def write(params):
+        with db.transaction() as conn:
+            conn.execute(INSERT, params)
+
+    def read():
+        with db.read() as conn:
+            conn.execute(LATEST).fetchall()
+
+    return write, read, db.close
+
+
+def workload(path, make, clients, duration, reads_per_write):
+    init_db(path)
+    write, read, close = make(path)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        reads = writes = errors = i = 0
+        while time.perf_counter() < deadline:
+            try:
+                write(row(n, i))
+                writes += 1
+                for _ in range(reads_per_write):
+                    read()
+                    reads += 1
+            except sqlite3.OperationalError:
+                # "database is locked" once the default 5s busy timeout runs out
+                errors += 1
+            i += 1
+        with lock:
+            counts["reads"] += reads
+            counts["writes"] += writes
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    close()
+    return {k: v / duration if k != "errors" else v for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call connections with the pooled Database")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--reads-per-write", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = workload(os.path.join(tmp, "before.db"), connect_per_call, args.clients, args.duration,
+                          args.reads_per_write)
+        after = workload(os.path.join(tmp, "after.db"), pooled, args.clients, args.duration, args.reads_per_write)
+
+    print(f"{'':8}{'writes/s':>12}{'reads/s':>12}{'errors':>8}")
+    print(f"{'before':8}{before['writes']:>12.0f}{before['reads']:>12.0f}{before['errors']:>8}")
+    print(f"{'after':8}{after['writes']:>12.0f}{after['reads']:>12.0f}{after['errors']:>8}")
+    print(f"speedup  writes x{after['writes'] / max(before['writes'], 1e-9):.2f}  "
+          f"reads x{after['reads'] / max(before['reads'], 1e-9):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import codecs
+import csv
+import json
+from collections import deque
+
+# Per-row errors beyond this are counted but not listed in the report
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(chunks):
+    """Yield decoded lines (without line endings) from an async iterator of byte chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def _ends_in_quoted_field(line, in_quotes):
+    """Whether a quoted field is still open after ``line``, under csv's default dialect.
+
+    A quote opens a field only at the start of the field; elsewhere in an
+    unquoted field it is a literal character, as in ``TV 55" panel``.
+    """
+    if not in_quotes and '"' not in line:
+        return False
+    field_start = not in_quotes
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if in_quotes:
+            if c == '"':
+                if i + 1 < n and line[i + 1] == '"':
+                    i += 1
+                else:
+                    in_quotes = False
+        elif c == '"' and field_start:
+            in_quotes = True
+        field_start = c == ","
+        i += 1
+    return in_quotes
+
+
+class _LineFeed:
+    """Lines for a long-lived csv.reader, handed over once a record is complete."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def iter_records(chunks, fmt):
+    """Yield ``(row_number, record)`` pairs from an NDJSON or CSV byte stream.
+
+    Only one record is held in memory at a time. ``record`` is a dict, or
+    the ValueError raised while parsing that row. Rows are numbered from 1,
+    not counting blank lines or the CSV header.
+    """
+    row_number = 0
+    if fmt == "ndjson":
+        async for line in iter_lines(chunks):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Expected a JSON object")
+            except ValueError as e:
+                record = e
+            yield row_number, record
+        return
+
+    header = None
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    in_quotes = False
+    async for line in iter_lines(chunks):
+        # A quoted field may span lines; the reader is only asked for a record once it is complete
+        feed.lines.append(line + "\n")
+        in_quotes = _ends_in_quoted_field(line, in_quotes)
+        if in_quotes:
+            continue
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            feed.lines.clear()
+            row_number += 1
+            yield row_number, ValueError(str(e))
+            continue
+        if not values or (len(values) == 1 and not values[0].strip()):
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            yield row_number, dict(zip(header, values))
+    if in_quotes:
+        yield row_number + 1, ValueError("Unterminated quoted field")
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.queued = 0
+        self.errors = []
+
+    def fail(self, row_number, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": str(getattr(error, "detail", error))})
+
+    def as_dict(self):
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "queued": self.queued,
+            "errors": self.errors,
+        }
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from metrics import db_timer
+
+DB_PATH = os.getenv("OPPORTUNITY_DB", "opportunity.db")
+
+# WAL lets readers run while a write commits; NORMAL sync is durable in WAL
+# mode except for the last transactions before a power loss.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class Database:
+    """Per-thread pool of SQLite connections to one database file.
+
+    Each thread opens one connection on first use and keeps it, so requests
+    skip the connect and PRAGMA cost, and each connection's statement cache
+    reuses prepared statements for repeated SQL. Blocking work from async
+    code goes through ``run()`` so it happens on a worker thread rather than
+    on the event loop.
+    """
+
+    def __init__(self, path=DB_PATH, cached_statements=256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can close it from another thread
+            conn = sqlite3.connect(self.path, cached_statements=self.cached_statements, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def read(self):
+        """Yield this thread's connection, counting the time as DB time."""
+        with db_timer():
+            yield self.connection()
+
+    @contextmanager
+    def transaction(self):
+        """Yield this thread's connection; commit on success, roll back on error."""
+        conn = self.connection()
+        with db_timer(), conn:
+            yield conn
+
+    async def run(self, fn, *args):
+        """Run blocking ``fn(*args)`` on a worker thread."""
+        return await asyncio.to_thread(fn, *args)
+
+    def close(self):
+        """Checkpoint the WAL into the main file and close every connection."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for i, conn in enumerate(connections):
+            if i == 0:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
@@ -1,8 +1,9 @@
 
 import sqlite3
+from db import DB_PATH
 
-def init_db():
-	conn = sqlite3.connect('opportunity.db')
+def init_db(path=DB_PATH):
+	conn = sqlite3.connect(path)
 	c = conn.cursor()
 	c.execute('''
 		CREATE TABLE IF NOT EXISTS opportunities (
@@ -20,6 +21,64 @@ def init_db():
 			insights TEXT
 		)
 	''')
+	# Added after the first release: pending/processing rows are the background insights queue
+	columns = {row[1] for row in c.execute('PRAGMA table_info(opportunities)')}
+	if 'insights_status' not in columns:
+		c.execute("ALTER TABLE opportunities ADD COLUMN insights_status TEXT NOT NULL DEFAULT 'done'")
+	c.execute('CREATE INDEX IF NOT EXISTS ix_opportunities_insights_status ON opportunities (insights_status)')
+	# When a worker claimed the row; processing rows with an old claim belong to a dead worker
+	if 'insights_claimed_at' not in columns:
+		c.execute('ALTER TABLE opportunities ADD COLUMN insights_claimed_at REAL')
+	# Bumped on every update, so cached HTML for a row can be keyed by (id, revision)
+	if 'revision' not in columns:
+		c.execute('ALTER TABLE opportunities ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+	c.execute('''
+		CREATE TRIGGER IF NOT EXISTS opportunities_bump_revision
+		AFTER UPDATE ON opportunities WHEN NEW.revision = OLD.revision
+		BEGIN
+			UPDATE opportunities SET revision = OLD.revision + 1 WHERE id = NEW.id;
+		END
+	''')
+	# Filters of /view_opportunity, each ordered by the id cursor
+	for column in ('client', 'type', 'complexity'):
+		c.execute(f'CREATE INDEX IF NOT EXISTS ix_opportunities_{column}_id ON opportunities ({column}, id)')
+	c.execute('''
+		CREATE TABLE IF NOT EXISTS insights_cache (
+			key TEXT PRIMARY KEY,
+			insights TEXT NOT NULL,
+			created_at REAL NOT NULL
+		)
+	''')
+	c.execute('CREATE INDEX IF NOT EXISTS ix_insights_cache_created_at ON insights_cache (created_at)')
+	# Normalized skills. opportunity_skills is the inverted index: one posting
+	# list per skill, clustered on (skill_id, opportunity_id).
+	c.execute('''
+		CREATE TABLE IF NOT EXISTS skills (
+			id INTEGER PRIMARY KEY,
+			name TEXT NOT NULL UNIQUE,
+			opportunity_count INTEGER NOT NULL DEFAULT 0
+		)
+	''')
+	c.execute('''
+		CREATE TABLE IF NOT EXISTS opportunity_skills (
+			skill_id INTEGER NOT NULL REFERENCES skills (id),
+			opportunity_id INTEGER NOT NULL REFERENCES opportunities (id),
+			PRIMARY KEY (skill_id, opportunity_id)
+		) WITHOUT ROWID
+	''')
+	c.execute('''
+		CREATE TABLE IF NOT EXISTS migration_progress (
+			name TEXT PRIMARY KEY,
+			last_id INTEGER NOT NULL,
+			target_id INTEGER NOT NULL
+		)
+	''')
+	# Rows up to the current max id predate skill indexing and are backfilled by
+	# skills.backfill(); every later insert indexes its own skills.
+	c.execute('''
+		INSERT OR IGNORE INTO migration_progress (name, last_id, target_id)
+		SELECT 'skills_backfill', 0, COALESCE(MAX(id), 0) FROM opportunities
+	''')
 	conn.commit()
 	conn.close()
 
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from html import escape
+
+# Columns a rendered row needs; everything except the bookkeeping columns
+ROW_COLUMNS = (
+    "id", "title", "client", "contact_name", "contact_email", "description", "type", "complexity",
+    "duration", "skills", "deal_value", "insights",
+)
+
+TABLE_HEAD = (
+    "<table class='opp-table'><thead><tr>"
+    "<th>ID</th><th>Title</th><th>Client</th><th>Contact Name</th><th>Contact Email</th>"
+    "<th>Description</th><th>Type</th><th>Complexity</th><th>Duration</th><th>Skills</th><th>Deal Value</th><th>Insights</th>"
+    "</tr></thead><tbody>"
+)
+TABLE_FOOT = "</tbody></table>"
+
+
+def render_row(row):
+    """Render one opportunity as an escaped ``<tr>``."""
+    cells = "".join(f"<td>{escape(str(row[column]))}</td>" for column in ROW_COLUMNS[:-1])
+    insights = row["insights"]
+    return f"<tr>{cells}<td><pre>{escape(insights) if insights is not None else ''}</pre></td></tr>"
+
+
+class FragmentCache:
+    """Rendered ``<tr>`` fragments by ``(id, revision)``, in LRU order.
+
+    ``revision`` changes on every update to a row, so a stale fragment is
+    simply never looked up again and ages out of the LRU.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def cache_key(opportunity, fields):
+    """Canonical hash of ``fields`` of an opportunity.
+
+    Strings are compared case-insensitively with whitespace collapsed and
+    numbers by value, so "ACME  Corp" / 5000 and "acme corp" / 5000.0 share
+    an entry.
+    """
+    canonical = json.dumps({f: _normalize(opportunity[f]) for f in fields}, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class InsightsCache:
+    """LLM insights by opportunity hash, in an LRU backed by ``insights_cache``.
+
+    Lookups try the in-memory LRU first, then the table. Entries expire
+    ``ttl`` seconds after they were generated. The LRU holds at most
+    ``max_entries``, and the table is pruned back to ``max_rows`` every
+    ``prune_every`` writes. ``get`` and ``put`` may touch the database, so
+    async callers should run them through ``Database.run``.
+    """
+
+    def __init__(self, db, ttl=7 * 24 * 3600, max_entries=10_000, max_rows=100_000,
+                 prune_every=100):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                insights, created_at = entry
+                if created_at + self.ttl > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return insights
+                del self._entries[key]
+        with self.db.read() as conn:
+            row = conn.execute(
+                "SELECT insights, created_at FROM insights_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            insights = json.loads(row[0])
+            self._remember(key, insights, row[1])
+            self.db_hits += 1
+            return insights
+
+    def put(self, key, insights):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, insights, created_at)
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO insights_cache (key, insights, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(insights), created_at),
+            )
+            if prune:
+                self._prune(conn)
+
+    def _remember(self, key, insights, created_at):
+        self._entries[key] = (insights, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune(self, conn):
+        conn.execute("DELETE FROM insights_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM insights_cache WHERE created_at < "
+            "(SELECT created_at FROM insights_cache ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows - 1,),
+        )
+
+    def stats(self):
+        lookups = self.hits + self.db_hits + self.misses
+        return {
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
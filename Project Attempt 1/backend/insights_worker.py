@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+# Bulk-imported without asking for insights; never picked up by the workers
+SKIPPED = "skipped"
+
+
+class InsightsWorkerPool:
+    """Background workers that fill in insights for opportunities saved as pending.
+
+    The ``insights_status`` column is the job queue's source of truth; the
+    in-memory queue only holds ids so idle workers wake up promptly. A worker
+    claims a row by moving it from pending to processing and stamping
+    ``insights_claimed_at``, awaits ``generate(opportunity)`` and stores the
+    result as done, or as failed if it returned an ``error``. At most
+    ``workers`` rows are processed at once.
+
+    A claim is a lease of ``lease_seconds``. ``start()``, and every
+    ``lease_seconds`` after it, moves processing rows whose lease ran out
+    (their worker died with its process) back to pending and queues them;
+    claims held by live workers, in this process or another one sharing the
+    database, are left alone. ``start()`` also queues every pending row, so
+    no submission is lost across restarts.
+    """
+
+    def __init__(self, generate, db, workers=4, lease_seconds=600.0):
+        self.generate = generate
+        self.db = db
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.completed = 0
+        self.failed = 0
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        with self.db.transaction() as conn:
+            expired = len(self._release_expired(conn))
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM opportunities WHERE insights_status = ? ORDER BY id", (PENDING,))]
+        if ids:
+            logger.info("Recovered %d pending insight jobs (%d with expired claims)", len(ids), expired)
+        for opportunity_id in ids:
+            self._queue.put_nowait(opportunity_id)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaim()))
+
+    async def stop(self):
+        """Cancel the workers. Rows they were processing are recovered by the next ``start()``."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, opportunity_id):
+        # Without running workers the row simply waits for the next start()
+        if self.running:
+            self._queue.put_nowait(opportunity_id)
+
+    async def join(self):
+        """Wait until every queued job has been processed."""
+        await self._queue.join()
+
+    def _release_expired(self, conn):
+        """Move processing rows whose claim is older than the lease back to pending; returns their ids."""
+        # Rows claimed before insights_claimed_at existed have no claim time
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM opportunities "
+            "WHERE insights_status = ? AND (insights_claimed_at IS NULL OR insights_claimed_at < ?) ORDER BY id",
+            (PROCESSING, time.time() - self.lease_seconds),
+        )]
+        conn.executemany(
+            "UPDATE opportunities SET insights_status = ?, insights_claimed_at = NULL WHERE id = ? AND insights_status = ?",
+            [(PENDING, opportunity_id, PROCESSING) for opportunity_id in ids],
+        )
+        return ids
+
+    def _reclaim_expired(self):
+        with self.db.transaction() as conn:
+            return self._release_expired(conn)
+
+    async def _reclaim(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                ids = await self.db.run(self._reclaim_expired)
+            except Exception:
+                logger.exception("Failed to requeue insight jobs with expired claims")
+                continue
+            if ids:
+                logger.warning("Requeued %d insight jobs whose claims expired", len(ids))
+            for opportunity_id in ids:
+                self._queue.put_nowait(opportunity_id)
+
+    async def _work(self):
+        while True:
+            opportunity_id = await self._queue.get()
+            try:
+                await self._process(opportunity_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Insights job %s crashed; it will be retried on restart", opportunity_id)
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, opportunity_id):
+        with self.db.transaction() as conn:
+            claimed = conn.execute(
+                "UPDATE opportunities SET insights_status = ?, insights_claimed_at = ? "
+                "WHERE id = ? AND insights_status = ?",
+                (PROCESSING, time.time(), opportunity_id, PENDING),
+            ).rowcount
+            if not claimed:
+                return None
+            return dict(conn.execute("SELECT * FROM opportunities WHERE id = ?", (opportunity_id,)).fetchone())
+
+    def _finish(self, opportunity_id, claimed_at, insights, outcome):
+        """Store the result if this worker's claim still holds; returns whether it did."""
+        with self.db.transaction() as conn:
+            return conn.execute(
+                "UPDATE opportunities SET insights = ?, insights_status = ?, insights_claimed_at = NULL "
+                "WHERE id = ? AND insights_status = ? AND insights_claimed_at = ?",
+                (json.dumps(insights), outcome, opportunity_id, PROCESSING, claimed_at),
+            ).rowcount > 0
+
+    async def _process(self, opportunity_id):
+        opportunity = await self.db.run(self._claim, opportunity_id)
+        if opportunity is None:
+            return
+        claimed_at = opportunity.pop("insights_claimed_at")
+        insights = await self.generate(opportunity)
+        outcome = FAILED if "error" in insights else DONE
+        if not await self.db.run(self._finish, opportunity_id, claimed_at, insights, outcome):
+            # The lease ran out and the row was requeued; the newer claim writes the result
+            logger.warning("Dropped insights for opportunity %s: its claim expired", opportunity_id)
+            return
+        if outcome == DONE:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def stats(self):
+        return {
+            "workers": self.workers if self.running else 0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,49 @@
+import asyncio
+import random
+import openai
+
+# Errors worth another attempt: the request never reached the model, or the
+# provider asked us to slow down or failed on its side.
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMClient:
+    """Async chat-completions client with a concurrency cap, timeouts and retries.
+
+    At most ``concurrency`` completions are in flight at once; further callers
+    wait on the semaphore without blocking the event loop. Each attempt is
+    bounded by ``timeout`` seconds, and retryable failures back off with full
+    jitter (a random delay up to ``backoff * 2 ** attempt``, capped at
+    ``backoff_max``). The semaphore is released while backing off.
+    """
+
+    def __init__(self, client, model, concurrency=4, timeout=30.0, max_retries=3, backoff=0.5, backoff_max=8.0):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def complete(self, prompt, **params):
+        """Return the message content of a single-prompt completion."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        timeout=self.timeout,
+                        **params,
+                    )
+                return response.choices[0].message.content
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
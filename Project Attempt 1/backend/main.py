@@ -1,42 +1,121 @@
 
 import os
+import asyncio
 import json
+import math
 import sqlite3
-from typing import Dict, Any
-from fastapi import FastAPI, HTTPException, status, Request
+from html import escape
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException, Query, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 import openai
 from dotenv import load_dotenv
+from db import Database
+from db_init import init_db
+from fragments import ROW_COLUMNS, TABLE_FOOT, TABLE_HEAD, FragmentCache, render_row
+from insights_cache import InsightsCache, cache_key
+from analytics import DIMENSIONS, Analytics
+from bulk_import import ImportReport, iter_records
+from insights_worker import DONE, FAILED, PENDING, SKIPPED, InsightsWorkerPool
+from llm import LLMClient
+from skills import backfill, index_skills, search_by_skills
+from metrics import Metrics, MetricsMiddleware, StackSampler
 
 # --- Configuration & Initialization ---
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db(db.path)
+    await db.run(analytics.warm, db)
+    insights_workers.start()
+    # Index skills of opportunities saved before the skills tables existed
+    skills_backfill = asyncio.create_task(backfill(db))
+    yield
+    skills_backfill.cancel()
+    # Let the batch in flight commit before its connection is closed
+    await asyncio.gather(skills_backfill, return_exceptions=True)
+    await insights_workers.stop()
+    db.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Request metrics for /metrics. Set PROFILE_DIR to also dump folded stacks
+# of requests slower than SLOW_REQUEST_MS.
+metrics = Metrics(slow_threshold=float(os.getenv("SLOW_REQUEST_MS", "1000")) / 1000)
+profile_dir = os.getenv("PROFILE_DIR")
+sampler = StackSampler(profile_dir, hz=int(os.getenv("PROFILE_HZ", "100"))) if profile_dir else None
+app.add_middleware(MetricsMiddleware, metrics=metrics, sampler=sampler)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
+REQUIRED_FIELDS = [
+    "title", "client", "contact_name", "contact_email", "description",
+    "type", "complexity", "duration", "skills", "deal_value"
+]
+
+
 def validate_opportunity(data: Dict[str, Any]) -> Dict[str, Any]:
-    required_fields = [
-        "title", "client", "contact_name", "contact_email", "description",
-        "type", "complexity", "duration", "skills", "deal_value"
-    ]
-    for field in required_fields:
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Expected a JSON object")
+    for field in REQUIRED_FIELDS:
         if field not in data:
             raise HTTPException(status_code=422, detail=f"Missing field: {field}")
-    # Optionally: add more validation here (e.g., email format, deal_value is float)
+        value = data[field]
+        # Columns hold strings and numbers; nested JSON would fail only at insert time
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise HTTPException(status_code=422, detail=f"{field} must be a string or number")
+    # Split by parse_skills into the skills index
+    if not isinstance(data["skills"], str):
+        raise HTTPException(status_code=422, detail="skills must be a string")
+    try:
+        deal_value = float(data["deal_value"])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="deal_value must be a number")
+    # NaN or infinity would poison the /analytics totals and percentiles
+    if not math.isfinite(deal_value):
+        raise HTTPException(status_code=422, detail="deal_value must be a finite number")
+    # Optionally: add more validation here (e.g., email format)
     return data
 
 # --- Utility Functions ---
-client = openai.OpenAI(
+# Per-thread connections to opportunity.db (or OPPORTUNITY_DB)
+db = Database()
+
+# The async client keeps slow completions from stalling the event loop.
+# Retries are handled by LLMClient, so the SDK's own retries are disabled.
+llm = LLMClient(
+    openai.AsyncOpenAI(
         api_key=os.getenv("OPENAI_API_KEY"),
-        base_url="https://api.groq.com/openai/v1",
-    )
+        base_url=os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1"),
+        max_retries=0,
+    ),
+    model=os.getenv("LLM_MODEL", "llama-3.3-70b-versatile"),
+    concurrency=int(os.getenv("LLM_CONCURRENCY", "4")),
+    timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+)
+
+# Insights for opportunities already seen, keyed by a hash of REQUIRED_FIELDS
+insights_cache = InsightsCache(
+    db,
+    ttl=float(os.getenv("INSIGHTS_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("INSIGHTS_CACHE_SIZE", "10000")),
+)
+
+# With INSIGHTS_MODE=background, POST /opportunity saves the row as pending and
+# returns 202; these workers generate the insights afterwards.
+INSIGHTS_BACKGROUND = os.getenv("INSIGHTS_MODE", "sync") == "background"
 
 async def generate_insights(data: dict) -> dict:
     """
@@ -62,16 +141,14 @@ async def generate_insights(data: dict) -> dict:
     - recommendations: (string, short actionable recommendations)
     """
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
+        content = await llm.complete(
+            prompt,
             temperature=1,
             max_completion_tokens=1024,
             top_p=1,
             stream=False,
             stop=None
         )
-        content = response.choices[0].message.content
         try:
             if content is not None:
                 insights = json.loads(content)
@@ -83,86 +160,299 @@ async def generate_insights(data: dict) -> dict:
     except Exception as e:
         return {"error": str(e)}
 
-def save_opportunity_to_db(opportunity: Dict[str, Any], insights: dict) -> None:
+async def insights_for(opportunity: Dict[str, Any]) -> dict:
+    """
+    Return cached insights for the opportunity, generating and caching them on a miss.
+    """
+    key = cache_key(opportunity, REQUIRED_FIELDS)
+    insights = await db.run(insights_cache.get, key)
+    if insights is None:
+        insights = await generate_insights(opportunity)
+        if "error" not in insights:
+            await db.run(insights_cache.put, key, insights)
+    return insights
+
+# Deal-value rollups for /analytics, kept current as opportunities are inserted
+analytics = Analytics()
+
+insights_workers = InsightsWorkerPool(
+    insights_for,
+    db,
+    workers=int(os.getenv("INSIGHTS_WORKERS", "4")),
+    lease_seconds=float(os.getenv("INSIGHTS_LEASE_SECONDS", "600")),
+)
+
+INSERT_OPPORTUNITY = '''
+    INSERT INTO opportunities (
+        title, client, contact_name, contact_email, description, type, complexity, duration, skills, deal_value, insights,
+        insights_status
+    ) VALUES (
+        :title, :client, :contact_name, :contact_email, :description, :type, :complexity, :duration, :skills, :deal_value,
+        :insights, :insights_status
+    )
+'''
+
+def opportunity_params(opportunity: Dict[str, Any], insights: Optional[dict], insights_status: str) -> dict:
+    """
+    Parameters for INSERT_OPPORTUNITY, from an opportunity that passed ``validate_opportunity``.
+    Raises ValueError or TypeError if deal_value is not a finite number.
+    """
+    params = {field: opportunity[field] for field in REQUIRED_FIELDS}
+    params["deal_value"] = float(opportunity["deal_value"])
+    if not math.isfinite(params["deal_value"]):
+        raise ValueError("deal_value must be a finite number")
+    params["insights"] = json.dumps(insights) if insights is not None else None
+    params["insights_status"] = insights_status
+    return params
+
+def save_opportunity_to_db(opportunity: Dict[str, Any], insights: Optional[dict], insights_status: str = DONE) -> int:
     """
-    Save the opportunity and its insights to the SQLite database.
+    Save the opportunity and its insights to the SQLite database and return its id.
+    This blocks, so async callers should use ``db.run``.
     Raises HTTPException on failure.
     """
+    params = opportunity_params(opportunity, insights, insights_status)
     try:
-        with sqlite3.connect('opportunity.db') as conn:
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO opportunities (
-                    title, client, contact_name, contact_email, description, type, complexity, duration, skills, deal_value, insights
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                opportunity["title"],
-                opportunity["client"],
-                opportunity["contact_name"],
-                opportunity["contact_email"],
-                opportunity["description"],
-                opportunity["type"],
-                opportunity["complexity"],
-                opportunity["duration"],
-                opportunity["skills"],
-                float(opportunity["deal_value"]),
-                json.dumps(insights)
-            ))
-            conn.commit()
+        with db.transaction() as conn:
+            opportunity_id = conn.execute(INSERT_OPPORTUNITY, params).lastrowid
+            index_skills(conn, [(opportunity_id, params["skills"])])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    analytics.add(opportunity_id, params)
+    return opportunity_id
+
+# Errors caused by one row's data rather than by the database
+ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError)
+
+def insert_opportunity_batch(batch: list) -> tuple:
+    """
+    Insert ``(row_number, params)`` pairs in one transaction with executemany.
+    If the batch violates a constraint or has a value sqlite3 cannot bind, rows
+    are retried one by one so only the offending rows fail. Returns the new ids and a list of ``(row_number, error)``.
+    """
+    try:
+        with db.transaction() as conn:
+            conn.executemany(INSERT_OPPORTUNITY, [params for _, params in batch])
+            # One writer inside the transaction, so the AUTOINCREMENT ids are contiguous
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            ids = list(range(last_id - len(batch) + 1, last_id + 1))
+            index_skills(conn, [(opportunity_id, params["skills"]) for opportunity_id, (_, params) in zip(ids, batch)])
+        for opportunity_id, (_, params) in zip(ids, batch):
+            analytics.add(opportunity_id, params)
+        return ids, []
+    except ROW_ERRORS:
+        pass
+    inserted, errors = [], []
+    with db.transaction() as conn:
+        conn.execute("BEGIN")
+        for row_number, params in batch:
+            try:
+                conn.execute("SAVEPOINT import_row")
+                opportunity_id = conn.execute(INSERT_OPPORTUNITY, params).lastrowid
+                index_skills(conn, [(opportunity_id, params["skills"])])
+                inserted.append((opportunity_id, params))
+                conn.execute("RELEASE import_row")
+            except ROW_ERRORS as e:
+                conn.execute("ROLLBACK TO import_row")
+                conn.execute("RELEASE import_row")
+                errors.append((row_number, e))
+    for opportunity_id, params in inserted:
+        analytics.add(opportunity_id, params)
+    return [opportunity_id for opportunity_id, _ in inserted], errors
 
 # --- API Endpoints ---
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/opportunity", status_code=status.HTTP_201_CREATED)
-async def create_opportunity(request: Request):
+async def create_opportunity(request: Request, response: Response, background: bool = INSIGHTS_BACKGROUND):
     """
     Receive opportunity data, generate insights, save to DB, and return insights.
+    With ``background`` the opportunity is saved right away and 202 is returned;
+    poll GET /opportunity/{id} for the insights.
     """
     data = await request.json()
     opportunity = validate_opportunity(data)
-    insights = await generate_insights(opportunity)
-    save_opportunity_to_db(opportunity, insights)
-    return {**opportunity, "insights": insights}
+    if background:
+        opportunity_id = await db.run(save_opportunity_to_db, opportunity, None, PENDING)
+        insights_workers.enqueue(opportunity_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {**opportunity, "id": opportunity_id, "insights": None, "insights_status": PENDING}
+    insights = await insights_for(opportunity)
+    insights_status = FAILED if "error" in insights else DONE
+    opportunity_id = await db.run(save_opportunity_to_db, opportunity, insights, insights_status)
+    return {**opportunity, "id": opportunity_id, "insights": insights, "insights_status": insights_status}
+
+
+@app.post("/opportunities/import")
+async def import_opportunities(request: Request, format: Optional[str] = None, queue_insights: bool = False,
+                               batch_size: int = 500):
+    """
+    Bulk-load opportunities from an NDJSON or CSV body (CSV needs a header row).
+    The format follows the Content-Type unless ``format`` is given. The body is
+    parsed as it streams in, and valid rows are inserted in transactions of
+    ``batch_size``. Invalid rows are reported by row number and skipped. With
+    ``queue_insights`` the rows are saved as pending for the insights workers;
+    otherwise they are saved without insights.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=422, detail="format must be ndjson or csv")
+    if batch_size < 1:
+        raise HTTPException(status_code=422, detail="batch_size must be positive")
+    insights_status = PENDING if queue_insights else SKIPPED
+    report = ImportReport()
+    batch = []
+
+    async def flush():
+        ids, errors = await db.run(insert_opportunity_batch, batch)
+        report.imported += len(ids)
+        for row_number, error in errors:
+            report.fail(row_number, error)
+        if queue_insights:
+            for opportunity_id in ids:
+                insights_workers.enqueue(opportunity_id)
+            report.queued += len(ids)
+        batch.clear()
+
+    async for row_number, record in iter_records(request.stream(), format):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append((row_number, opportunity_params(validate_opportunity(record), None, insights_status)))
+        except (HTTPException, ValueError, TypeError) as e:
+            report.fail(row_number, e)
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return report.as_dict()
+
+
+@app.get("/analytics")
+def get_analytics(group_by: str = "type"):
+    """
+    Deal-value count, total, mean and percentiles for all opportunities and per
+    ``group_by`` value (type, complexity, client or skill), largest total first.
+    """
+    if group_by not in DIMENSIONS:
+        raise HTTPException(status_code=422, detail=f"group_by must be one of {', '.join(DIMENSIONS)}")
+    analytics.ensure_warm(db)
+    return analytics.summary(group_by)
+
+
+@app.get("/opportunities")
+def search_opportunities(skill: List[str] = Query(...), limit: int = Query(50, ge=1, le=500),
+                         before: Optional[int] = None):
+    """
+    Opportunities that have every requested skill, newest first, without their insights.
+    For the next page pass ``next_cursor`` as ``before``.
+    """
+    with db.read() as conn:
+        ids = search_by_skills(conn, skill, limit + 1, before)
+        next_cursor = ids[limit - 1] if len(ids) > limit else None
+        ids = ids[:limit]
+        rows = conn.execute(
+            "SELECT id, title, client, type, complexity, duration, skills, deal_value, insights_status "
+            f"FROM opportunities WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id DESC",
+            ids,
+        ).fetchall()
+    return {"opportunities": [dict(row) for row in rows], "next_cursor": next_cursor}
+
+
+@app.get("/opportunity/{opportunity_id}")
+def get_opportunity(opportunity_id: int):
+    """
+    Return one opportunity with its insights and insights_status
+    (pending, processing, done or failed).
+    """
+    with db.read() as conn:
+        row = conn.execute("SELECT * FROM opportunities WHERE id = ?", (opportunity_id,)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Opportunity not found")
+    opportunity = dict(row)
+    if opportunity["insights"] is not None:
+        opportunity["insights"] = json.loads(opportunity["insights"])
+    return opportunity
+
+
+@app.get("/insights/workers")
+def get_insights_workers():
+    return insights_workers.stats()
+
+
+@app.get("/insights/cache-stats")
+def get_insights_cache_stats():
+    return insights_cache.stats()
 
 
 # --- View Opportunities Endpoint ---
-from fastapi.responses import HTMLResponse
+# Rendered table rows by (id, revision), so dashboard refreshes mostly skip the
+# full-row query and the HTML rendering
+fragment_cache = FragmentCache(max_entries=int(os.getenv("FRAGMENT_CACHE_SIZE", "10000")))
+metrics.gauge("view_fragment_cache_hit_rate", "Share of /view_opportunity rows served from cached HTML.",
+              lambda: fragment_cache.stats()["hit_rate"])
+
+# Rows fetched and rendered per streamed chunk
+RENDER_BATCH = 50
+
+def render_page(page: list, next_cursor: Optional[int]):
+    """
+    Yield the HTML table for ``page`` (``id, revision`` rows) in chunks. Only rows
+    missing from the fragment cache are read in full.
+    """
+    yield TABLE_HEAD
+    for start in range(0, len(page), RENDER_BATCH):
+        batch = page[start:start + RENDER_BATCH]
+        fragments = {row["id"]: fragment_cache.get((row["id"], row["revision"])) for row in batch}
+        missing = [opportunity_id for opportunity_id, fragment in fragments.items() if fragment is None]
+        if missing:
+            with db.read() as conn:
+                rows = conn.execute(
+                    f"SELECT {', '.join(ROW_COLUMNS)}, revision FROM opportunities "
+                    f"WHERE id IN ({', '.join('?' * len(missing))})",
+                    missing,
+                ).fetchall()
+            for row in rows:
+                fragments[row["id"]] = render_row(row)
+                fragment_cache.put((row["id"], row["revision"]), fragments[row["id"]])
+        # A row deleted since the page query simply drops out
+        yield "".join(fragments[row["id"]] or "" for row in batch)
+    yield TABLE_FOOT
+    if next_cursor is not None:
+        yield f"<div class='opp-next' data-before='{next_cursor}'></div>"
 
 @app.get("/view_opportunity", response_class=HTMLResponse)
-def view_opportunity():
+def view_opportunity(client: Optional[str] = None, type: Optional[str] = None, complexity: Optional[str] = None,
+                     before: Optional[int] = None, limit: int = Query(10, ge=1, le=200)):
     """
-    Fetch the latest 10 opportunities from the database and return as an HTML table.
+    Stream the newest opportunities matching the filters as an HTML table, ``limit`` per page.
+    For the next page pass the ``X-Next-Cursor`` header (also in the trailing
+    ``.opp-next`` div) as ``before``.
     """
+    conditions, params = [], []
+    for column, value in (("client", client), ("type", type), ("complexity", complexity)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if before is not None:
+        conditions.append("id < ?")
+        params.append(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     try:
-        with sqlite3.connect('opportunity.db') as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            c.execute("SELECT * FROM opportunities ORDER BY id DESC LIMIT 10")
-            rows = c.fetchall()
-            if not rows:
-                return "<div>No opportunities found.</div>"
-            table = [
-                "<table class='opp-table'><thead><tr>"
-                "<th>ID</th><th>Title</th><th>Client</th><th>Contact Name</th><th>Contact Email</th>"
-                "<th>Description</th><th>Type</th><th>Complexity</th><th>Duration</th><th>Skills</th><th>Deal Value</th><th>Insights</th>"
-                "</tr></thead><tbody>"
-            ]
-            for row in rows:
-                table.append(f"<tr>"
-                    f"<td>{row['id']}</td>"
-                    f"<td>{row['title']}</td>"
-                    f"<td>{row['client']}</td>"
-                    f"<td>{row['contact_name']}</td>"
-                    f"<td>{row['contact_email']}</td>"
-                    f"<td>{row['description']}</td>"
-                    f"<td>{row['type']}</td>"
-                    f"<td>{row['complexity']}</td>"
-                    f"<td>{row['duration']}</td>"
-                    f"<td>{row['skills']}</td>"
-                    f"<td>{row['deal_value']}</td>"
-                    f"<td><pre>{row['insights']}</pre></td>"
-                "</tr>")
-            table.append("</tbody></table>")
-            return "".join(table)
+        with db.read() as conn:
+            page = conn.execute(
+                f"SELECT id, revision FROM opportunities {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1)
+            ).fetchall()
     except Exception as e:
-        return f"<div style='color:red;'><b>Error:</b> {e}</div>"
\ No newline at end of file
+        return f"<div style='color:red;'><b>Error:</b> {escape(str(e))}</div>"
+    if not page:
+        return "<div>No opportunities found.</div>"
+    next_cursor = page[limit - 1]["id"] if len(page) > limit else None
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return StreamingResponse(render_page(page[:limit], next_cursor), media_type="text/html", headers=headers)
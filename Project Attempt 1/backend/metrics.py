@@ -0,0 +1,207 @@
+# The snake backend (02-end-to-end) has its own copy of this module because each
+# backend image is built from its own directory; keep the two in step. This one
+# times SQL with db_timer() instead of SQLAlchemy events and has no event streams.
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds spent in the database by the current request, as a one-element list
+# so db_timer() blocks deeper in the call stack (or in the threadpool) can add to it.
+_db_time = ContextVar("db_time", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Metrics:
+    """Per-route request metrics, rendered in the Prometheus text format."""
+
+    def __init__(self, slow_threshold=1.0):
+        self.slow_threshold = slow_threshold
+        self.latency = defaultdict(Histogram)
+        self.db_seconds = defaultdict(float)
+        self.handler_seconds = defaultdict(float)
+        self.requests = Counter()
+        self.slow_requests = Counter()
+        self._gauges = []
+
+    def gauge(self, name, help_text, fn):
+        """Export ``fn()`` as a gauge every time /metrics is scraped."""
+        self._gauges.append((name, help_text, fn))
+
+    def record(self, method, route, status, duration, db_time):
+        key = (method, route)
+        self.latency[key].observe(duration)
+        self.db_seconds[key] += db_time
+        self.handler_seconds[key] += duration - db_time
+        self.requests[(method, route, status)] += 1
+        if duration >= self.slow_threshold:
+            self.slow_requests[key] += 1
+
+    def render(self):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), hist in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+            lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le='+Inf')} {hist.count}")
+            lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {hist.sum}")
+            lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {hist.count}")
+        for name, help_text, series in (
+            ("http_request_db_seconds_total", "Time spent executing SQL, by route.", self.db_seconds),
+            ("http_request_handler_seconds_total", "Time spent outside SQL, by route.", self.handler_seconds),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), value in sorted(series.items()):
+                lines.append(f"{name}{_labels(method=method, route=route)} {value}")
+        lines += ["# HELP http_requests_total Requests by route and status.", "# TYPE http_requests_total counter"]
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {value}")
+        lines += [
+            f"# HELP http_slow_requests_total Requests slower than {self.slow_threshold}s.",
+            "# TYPE http_slow_requests_total counter",
+        ]
+        for (method, route), value in sorted(self.slow_requests.items()):
+            lines.append(f"http_slow_requests_total{_labels(method=method, route=route)} {value}")
+        for name, help_text, fn in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {fn()}"]
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def db_timer():
+    """Count the enclosed block as database time for the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spent = _db_time.get()
+        if spent is not None:
+            spent[0] += time.perf_counter() - start
+
+
+class StackSampler:
+    """Opt-in sampling profiler for every thread of the process.
+
+    A daemon thread records the Python stack of each other thread ``hz``
+    times a second into a ring buffer, rooted at the thread's name so that
+    event-loop work and sync handlers running on the threadpool show up as
+    separate towers. When a request exceeds the slow threshold, the samples
+    taken during it are written to ``output_dir`` as folded stacks (one
+    ``frame;frame;frame count`` line per stack). flamegraph.pl, speedscope
+    and inferno all read this format. Samples are not tied to a request, so
+    a dump also shows whatever else ran at the same time, including idle
+    pool threads parked in their wait.
+    """
+
+    def __init__(self, output_dir, hz=100, window_seconds=60):
+        self.output_dir = output_dir
+        self.interval = 1.0 / hz
+        self.window_seconds = window_seconds
+        self._samples = deque()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.perf_counter()
+            while self._samples and self._samples[0][0] < now - self.window_seconds:
+                self._samples.popleft()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self._samples.append((now, ";".join(reversed(stack))))
+
+    def dump(self, start, end, label):
+        stacks = Counter(stack for ts, stack in list(self._samples) if start <= ts <= end)
+        if not stacks:
+            return None
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, DB time and slow requests per route."""
+
+    def __init__(self, app, metrics, sampler=None):
+        self.app = app
+        self.metrics = metrics
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.sampler is not None:
+            self.sampler.start()
+        status = 500
+        spent = [0.0]
+        token = _db_time.set(spent)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            _db_time.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.record(scope["method"], route, status, end - start, spent[0])
+            if self.sampler is not None and end - start >= self.metrics.slow_threshold:
+                self.sampler.dump(start, end, f"{scope['method']} {route}")
@@ -0,0 +1,132 @@
+import asyncio
+import re
+
+_SEPARATORS = re.compile(r"[,;|\n]+")
+
+
+def parse_skills(text):
+    """Split a free-text skills field into normalized skill names.
+
+    Skills are separated by commas, semicolons, pipes or newlines (not by
+    slashes, which appear inside names like "CI/CD"). They are lower-cased
+    with whitespace collapsed and de-duplicated in order, so
+    "Python, SQL;  machine   learning, python" becomes
+    ["python", "sql", "machine learning"].
+    """
+    seen = {}
+    for part in _SEPARATORS.split(text or ""):
+        skill = " ".join(part.split()).casefold()
+        if skill:
+            seen.setdefault(skill, None)
+    return list(seen)
+
+
+def index_skills(conn, rows):
+    """Add ``(opportunity_id, skills_text)`` rows to the skills index.
+
+    Runs inside the caller's transaction, so an opportunity and its postings
+    commit together. Re-indexing a row is a no-op.
+    """
+    for opportunity_id, text in rows:
+        for name in parse_skills(text):
+            conn.execute("INSERT OR IGNORE INTO skills (name) VALUES (?)", (name,))
+            added = conn.execute(
+                "INSERT OR IGNORE INTO opportunity_skills (skill_id, opportunity_id) "
+                "SELECT id, ? FROM skills WHERE name = ?",
+                (opportunity_id, name),
+            ).rowcount
+            if added:
+                conn.execute("UPDATE skills SET opportunity_count = opportunity_count + 1 WHERE name = ?", (name,))
+
+
+def search_by_skills(conn, names, limit, before=None):
+    """Ids of opportunities that have every skill in ``names``, newest first.
+
+    The posting lists are intersected smallest first. The shortest list is
+    walked backwards from ``before``, and each candidate is probed in the
+    other lists by primary key, so the cost follows the rarest skill rather
+    than the table size.
+    """
+    names = list(dict.fromkeys(skill for name in names for skill in parse_skills(name)))
+    if not names:
+        return []
+    found = conn.execute(
+        f"SELECT id, opportunity_count FROM skills WHERE name IN ({', '.join('?' * len(names))})", names
+    ).fetchall()
+    if len(found) < len(names):
+        return []
+    skill_ids = [skill_id for skill_id, _ in sorted(found, key=lambda row: row[1])]
+    # CROSS JOIN makes SQLite keep this join order, i.e. the smallest list outermost
+    joins = "".join(
+        f" CROSS JOIN opportunity_skills p{i} ON p{i}.skill_id = ? AND p{i}.opportunity_id = p0.opportunity_id"
+        for i in range(1, len(skill_ids))
+    )
+    params = skill_ids[1:] + [skill_ids[0]]
+    cursor = ""
+    if before is not None:
+        cursor = " AND p0.opportunity_id < ?"
+        params.append(before)
+    rows = conn.execute(
+        f"SELECT p0.opportunity_id FROM opportunity_skills p0{joins} "
+        f"WHERE p0.skill_id = ?{cursor} ORDER BY p0.opportunity_id DESC LIMIT ?",
+        params + [limit],
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def backfill_batch(db, batch_size=1000):
+    """Index the skills of the next ``batch_size`` opportunities saved before indexing existed.
+
+    Each batch and its progress marker commit together, so an interrupted
+    backfill resumes where it stopped. Returns whether rows remain.
+    """
+    with db.transaction() as conn:
+        progress = conn.execute(
+            "SELECT last_id, target_id FROM migration_progress WHERE name = 'skills_backfill'"
+        ).fetchone()
+        if progress is None or progress[0] >= progress[1]:
+            return False
+        last_id, target_id = progress
+        rows = conn.execute(
+            "SELECT id, skills FROM opportunities WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (last_id, target_id, batch_size),
+        ).fetchall()
+        index_skills(conn, rows)
+        last_id = rows[-1][0] if len(rows) == batch_size else target_id
+        conn.execute("UPDATE migration_progress SET last_id = ? WHERE name = 'skills_backfill'", (last_id,))
+        return last_id < target_id
+
+
+async def backfill(db, batch_size=1000):
+    """Run ``backfill_batch`` on worker threads until the backfill is complete.
+
+    Cancelling stops it after the batch in flight, which keeps running on its
+    thread either way, has committed.
+    """
+    while True:
+        batch = asyncio.ensure_future(db.run(backfill_batch, db, batch_size))
+        try:
+            more = await asyncio.shield(batch)
+        except asyncio.CancelledError:
+            await asyncio.gather(batch, return_exceptions=True)
+            raise
+        if not more:
+            return
+        await asyncio.sleep(0)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import Database
+    from db_init import init_db
+
+    parser = argparse.ArgumentParser(description="Backfill the skills index for existing opportunities")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    database = Database()
+    init_db(database.path)
+    batches = 1
+    while backfill_batch(database, args.batch_size):
+        batches += 1
+    print(f"Skills index backfilled in {batches} batches")
+    database.close()
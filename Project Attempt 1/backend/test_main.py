@@ -0,0 +1,645 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import numpy as np
+from fastapi.testclient import TestClient
+import openai
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import main
+from db import Database
+from db_init import init_db
+from insights_cache import InsightsCache
+from llm import LLMClient
+from skills import backfill_batch, parse_skills, search_by_skills
+
+OPPORTUNITY = {
+    "title": "Data platform", "client": "Acme", "contact_name": "Sam", "contact_email": "sam@acme.test",
+    "description": "Warehouse migration", "type": "Consulting", "complexity": "High", "duration": "3 months",
+    "skills": "python, sql", "deal_value": 50000,
+}
+
+
+class StubLLM:
+    """Local chat-completions server that answers after ``delay`` seconds.
+
+    The first ``failures`` requests get a 500 so retries can be exercised.
+    """
+
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.calls += 1
+                time.sleep(stub.delay)
+                if stub.calls <= stub.failures:
+                    body, code = b'{"error": {"message": "overloaded"}}', 500
+                else:
+                    content = json.dumps({"recommendations": "follow up"})
+                    body, code = json.dumps({
+                        "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                    }).encode(), 200
+                try:
+                    self.send_response(code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client timed out and hung up
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = Database(str(tmp_path / "opportunity.db"))
+    init_db(database.path)
+    monkeypatch.setattr(main, "db", database)
+    monkeypatch.setattr(main, "insights_cache", InsightsCache(database))
+    monkeypatch.setattr(main, "analytics", main.Analytics())
+    yield database
+    database.close()
+
+
+def use_stub(monkeypatch, stub, **options):
+    client = openai.AsyncOpenAI(api_key="test", base_url=stub.url, max_retries=0)
+    monkeypatch.setattr(main, "llm", LLMClient(client, model="stub", **options))
+
+
+async def post_opportunities(n):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.post("/opportunity", json=OPPORTUNITY) for _ in range(n)))
+
+
+def test_concurrent_opportunities_overlap_llm_calls(db, monkeypatch):
+    stub = StubLLM(delay=0.3)
+    use_stub(monkeypatch, stub, concurrency=8)
+    try:
+        start = time.perf_counter()
+        responses = asyncio.run(post_opportunities(6))
+        elapsed = time.perf_counter() - start
+    finally:
+        stub.close()
+    assert all(r.status_code == 201 for r in responses)
+    assert all(r.json()["insights"] == {"recommendations": "follow up"} for r in responses)
+    # Serialized calls would take 6 * 0.3s
+    assert elapsed < 1.2
+
+
+def test_concurrency_cap_limits_parallel_llm_calls(db, monkeypatch):
+    stub = StubLLM(delay=0.2)
+    use_stub(monkeypatch, stub, concurrency=1)
+    try:
+        start = time.perf_counter()
+        asyncio.run(post_opportunities(3))
+        elapsed = time.perf_counter() - start
+    finally:
+        stub.close()
+    assert elapsed >= 0.6
+
+
+def test_llm_errors_are_retried_with_backoff(db, monkeypatch):
+    stub = StubLLM(failures=2)
+    use_stub(monkeypatch, stub, max_retries=3, backoff=0.01)
+    try:
+        [response] = asyncio.run(post_opportunities(1))
+    finally:
+        stub.close()
+    assert stub.calls == 3
+    assert response.json()["insights"] == {"recommendations": "follow up"}
+
+
+def test_llm_timeout_is_reported_as_error(db, monkeypatch):
+    stub = StubLLM(delay=0.5)
+    use_stub(monkeypatch, stub, timeout=0.05, max_retries=0)
+    try:
+        [response] = asyncio.run(post_opportunities(1))
+    finally:
+        stub.close()
+    assert response.status_code == 201
+    assert "error" in response.json()["insights"]
+
+
+def test_database_keeps_one_wal_connection_per_thread(db):
+    conn = db.connection()
+    assert db.connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_repeated_opportunity_is_served_from_insights_cache(db, monkeypatch):
+    stub = StubLLM()
+    use_stub(monkeypatch, stub)
+    variant = {**OPPORTUNITY, "client": "  ACME ", "deal_value": 50000.0}
+    try:
+        [first] = asyncio.run(post_opportunities(1))
+        transport = httpx.ASGITransport(app=main.app)
+
+        async def post_variant():
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/opportunity", json=variant)
+
+        second = asyncio.run(post_variant())
+    finally:
+        stub.close()
+    assert stub.calls == 1
+    assert second.json()["insights"] == first.json()["insights"]
+    stats = main.insights_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_insights_cache_persists_and_expires(db, monkeypatch):
+    cache = InsightsCache(db, ttl=60)
+    cache.put("k", {"recommendations": "call"})
+    # A fresh instance (e.g. after a restart) falls back to the table
+    restarted = InsightsCache(db, ttl=60)
+    assert restarted.get("k") == {"recommendations": "call"}
+    assert restarted.stats()["db_hits"] == 1
+    assert restarted.get("k") == {"recommendations": "call"}
+    assert restarted.stats()["hits"] == 1
+
+    now = time.time()
+    monkeypatch.setattr("insights_cache.time.time", lambda: now + 61)
+    assert restarted.get("k") is None
+    assert InsightsCache(db, ttl=60).get("k") is None
+
+
+def test_insights_cache_evicts_by_size():
+    cache = InsightsCache(None, max_entries=2)
+    cache._remember("a", {}, time.time())
+    cache._remember("b", {}, time.time())
+    cache._remember("a", {}, time.time())
+    cache._remember("c", {}, time.time())
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_llm_errors_are_not_cached(db, monkeypatch):
+    stub = StubLLM(failures=1)
+    use_stub(monkeypatch, stub, max_retries=0)
+    try:
+        asyncio.run(post_opportunities(1))
+        [response] = asyncio.run(post_opportunities(1))
+    finally:
+        stub.close()
+    assert stub.calls == 2
+    assert response.json()["insights"] == {"recommendations": "follow up"}
+
+
+def test_background_mode_returns_immediately_and_fills_insights(db, monkeypatch):
+    stub = StubLLM(delay=0.3)
+    use_stub(monkeypatch, stub)
+    monkeypatch.setattr(main, "insights_workers", main.InsightsWorkerPool(main.insights_for, db, workers=2))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                start = time.perf_counter()
+                r = await client.post("/opportunity", params={"background": True}, json=OPPORTUNITY)
+                accepted_in = time.perf_counter() - start
+                pending = (await client.get(f"/opportunity/{r.json()['id']}")).json()
+                await main.insights_workers.join()
+                done = (await client.get(f"/opportunity/{r.json()['id']}")).json()
+                missing = await client.get("/opportunity/999")
+        return r, accepted_in, pending, done, missing
+
+    try:
+        r, accepted_in, pending, done, missing = asyncio.run(scenario())
+    finally:
+        stub.close()
+    assert r.status_code == 202
+    assert r.json()["insights_status"] == "pending"
+    assert accepted_in < 0.3
+    assert pending["insights_status"] in ("pending", "processing")
+    assert done["insights_status"] == "done"
+    assert done["insights"] == {"recommendations": "follow up"}
+    assert missing.status_code == 404
+
+
+def test_interrupted_insight_jobs_are_recovered_on_startup(db, monkeypatch):
+    stub = StubLLM()
+    use_stub(monkeypatch, stub)
+    interrupted = main.save_opportunity_to_db(OPPORTUNITY, None, "processing")
+    queued = main.save_opportunity_to_db({**OPPORTUNITY, "title": "Other"}, None, "pending")
+    workers = main.InsightsWorkerPool(main.insights_for, db, workers=2)
+
+    async def scenario():
+        workers.start()
+        await workers.join()
+        await workers.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.close()
+    assert stub.calls == 2
+    assert workers.stats()["completed"] == 2
+    for opportunity_id in (interrupted, queued):
+        assert main.get_opportunity(opportunity_id)["insights_status"] == "done"
+
+
+def test_startup_leaves_claims_of_live_workers_alone(db, monkeypatch):
+    stub = StubLLM()
+    use_stub(monkeypatch, stub)
+    live = main.save_opportunity_to_db(OPPORTUNITY, None, "processing")
+    expired = main.save_opportunity_to_db({**OPPORTUNITY, "title": "Other"}, None, "processing")
+    with db.transaction() as conn:
+        conn.execute("UPDATE opportunities SET insights_claimed_at = ? WHERE id = ?", (time.time(), live))
+        conn.execute("UPDATE opportunities SET insights_claimed_at = ? WHERE id = ?", (time.time() - 3600, expired))
+    workers = main.InsightsWorkerPool(main.insights_for, db, workers=2, lease_seconds=60)
+
+    async def scenario():
+        workers.start()
+        await workers.join()
+        await workers.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.close()
+    assert stub.calls == 1
+    assert main.get_opportunity(live)["insights_status"] == "processing"
+    assert main.get_opportunity(expired)["insights_status"] == "done"
+
+
+def test_worker_drops_results_after_losing_its_claim(db):
+    opportunity_id = main.save_opportunity_to_db(OPPORTUNITY, None, "pending")
+
+    async def generate(opportunity):
+        # Meanwhile the lease expired and another worker claimed the row
+        with db.transaction() as conn:
+            conn.execute("UPDATE opportunities SET insights_claimed_at = ? WHERE id = ?", (time.time() + 1, opportunity_id))
+        return {"recommendations": "stale"}
+
+    workers = main.InsightsWorkerPool(generate, db, workers=1)
+
+    async def scenario():
+        workers.start()
+        await workers.join()
+        await workers.stop()
+
+    asyncio.run(scenario())
+    row = main.get_opportunity(opportunity_id)
+    assert row["insights_status"] == "processing"
+    assert row["insights"] is None
+    assert workers.stats()["completed"] == 0
+
+
+def test_failed_background_insights_are_marked_failed(db, monkeypatch):
+    stub = StubLLM(failures=1)
+    use_stub(monkeypatch, stub, max_retries=0)
+    opportunity_id = main.save_opportunity_to_db(OPPORTUNITY, None, "pending")
+    workers = main.InsightsWorkerPool(main.insights_for, db, workers=1)
+
+    async def scenario():
+        workers.start()
+        await workers.join()
+        await workers.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.close()
+    row = main.get_opportunity(opportunity_id)
+    assert row["insights_status"] == "failed"
+    assert "error" in row["insights"]
+
+
+def post_import(body, chunk_size=None, **params):
+    """POST ``body`` to the import endpoint, streamed in ``chunk_size`` pieces if given."""
+    transport = httpx.ASGITransport(app=main.app)
+
+    async def stream():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def send():
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            content = stream() if chunk_size else body
+            return await client.post("/opportunities/import", params=params, content=content)
+
+    return asyncio.run(send())
+
+
+def test_bulk_import_ndjson_reports_bad_rows_without_aborting(db):
+    rows = [
+        json.dumps(OPPORTUNITY),
+        "{not json",
+        json.dumps({**OPPORTUNITY, "title": None}),
+        "",
+        json.dumps({k: v for k, v in OPPORTUNITY.items() if k != "skills"}),
+        json.dumps({**OPPORTUNITY, "deal_value": "lots"}),
+        json.dumps({**OPPORTUNITY, "title": "Second"}),
+    ]
+    r = post_import("\n".join(rows).encode(), batch_size=2)
+    report = r.json()
+    assert (report["imported"], report["failed"], report["queued"]) == (2, 4, 0)
+    assert [e["row"] for e in sorted(report["errors"], key=lambda e: e["row"])] == [2, 3, 4, 5]
+    assert any("skills" in e["error"] for e in report["errors"])
+    titles = [row["title"] for row in db.connection().execute("SELECT title, insights_status FROM opportunities")]
+    assert titles == ["Data platform", "Second"]
+    assert main.get_opportunity(1)["insights_status"] == "skipped"
+
+
+def test_bulk_import_csv_handles_quoted_multiline_fields(db):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(OPPORTUNITY)
+    writer.writerow(OPPORTUNITY.values())
+    writer.writerow({**OPPORTUNITY, "description": 'Two line,\nquoted "description"'}.values())
+    writer.writerow(["short", "row"])
+    # Excel-style BOM, and a small chunk size so records straddle chunk boundaries
+    body = ("\ufeff" + out.getvalue()).encode()
+    r = post_import(body, chunk_size=7, format="csv")
+    report = r.json()
+    assert (report["imported"], report["failed"]) == (2, 1)
+    assert report["errors"][0]["row"] == 3
+    assert main.get_opportunity(2)["description"] == 'Two line,\nquoted "description"'
+    assert main.get_opportunity(2)["deal_value"] == 50000.0
+
+
+def test_bulk_import_csv_keeps_literal_quotes_in_unquoted_fields(db):
+    header = ",".join(OPPORTUNITY)
+    fields = {**OPPORTUNITY, "skills": "python"}
+    row = ",".join(str(value) for value in {**fields, "title": 'TV 55" panel'}.values())
+    quoted = ",".join(str(value) for value in {**fields, "title": '"Second"'}.values())
+    r = post_import(f"{header}\n{row}\n{quoted}\n".encode(), chunk_size=5, format="csv")
+    assert (r.json()["imported"], r.json()["failed"]) == (2, 0)
+    assert main.get_opportunity(1)["title"] == 'TV 55" panel'
+    assert main.get_opportunity(2)["title"] == "Second"
+
+
+def test_bulk_import_rejects_non_scalar_fields_per_row(db):
+    rows = [
+        json.dumps({**OPPORTUNITY, "description": {"nested": True}}),
+        json.dumps({**OPPORTUNITY, "client": ["Acme"]}),
+        json.dumps(OPPORTUNITY),
+    ]
+    report = post_import("\n".join(rows).encode()).json()
+    assert (report["imported"], report["failed"]) == (1, 2)
+    assert [e["row"] for e in report["errors"]] == [1, 2]
+
+
+def test_non_finite_deal_values_are_rejected(db):
+    rows = [json.dumps({**OPPORTUNITY, "deal_value": value}) for value in ("inf", "NaN", float("-inf"))]
+    report = post_import("\n".join(rows + [json.dumps(OPPORTUNITY)]).encode()).json()
+    assert (report["imported"], report["failed"]) == (1, 3)
+    assert all("finite" in e["error"] for e in report["errors"])
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/opportunity", json={**OPPORTUNITY, "deal_value": "Infinity"})
+
+    r = asyncio.run(post())
+    assert r.status_code == 422
+    assert main.get_analytics()["overall"]["count"] == 1
+
+
+def test_create_opportunity_rejects_non_scalar_fields_before_insights(db, monkeypatch):
+    stub = StubLLM()
+    use_stub(monkeypatch, stub)
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/opportunity", json={**OPPORTUNITY, "title": {"a": 1}})
+
+    try:
+        r = asyncio.run(post())
+    finally:
+        stub.close()
+    assert r.status_code == 422
+    assert "title" in r.json()["detail"]
+    assert stub.calls == 0
+    assert db.connection().execute("SELECT COUNT(*) FROM opportunities").fetchone()[0] == 0
+
+
+def test_bulk_import_can_queue_insights(db, monkeypatch):
+    stub = StubLLM()
+    use_stub(monkeypatch, stub)
+    monkeypatch.setattr(main, "insights_workers", main.InsightsWorkerPool(main.insights_for, db, workers=2))
+    body = "\n".join(json.dumps({**OPPORTUNITY, "title": f"Row {i}"}) for i in range(5)).encode()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                r = await client.post("/opportunities/import", params={"queue_insights": True, "batch_size": 2},
+                                      content=body, headers={"Content-Type": "application/x-ndjson"})
+                await main.insights_workers.join()
+        return r
+
+    try:
+        r = asyncio.run(scenario())
+    finally:
+        stub.close()
+    assert r.json()["queued"] == 5
+    assert all(main.get_opportunity(i)["insights_status"] == "done" for i in range(1, 6))
+
+
+def get_view(**params):
+    return TestClient(main.app).get("/view_opportunity", params=params)
+
+
+def test_view_opportunity_paginates_and_filters(db):
+    for i in range(25):
+        main.save_opportunity_to_db({**OPPORTUNITY, "title": f"Row {i}", "client": "Acme" if i % 5 else "Beta"}, None)
+    first = get_view()
+    assert first.text.count("<tr>") == 11  # header + 10 rows
+    assert "Row 24" in first.text and "Row 15" in first.text and "Row 14" not in first.text
+    cursor = first.headers["X-Next-Cursor"]
+    assert f"data-before='{cursor}'" in first.text
+    second = get_view(before=cursor, limit=20)
+    assert second.text.count("<tr>") == 16
+    assert "X-Next-Cursor" not in second.headers
+    beta = get_view(client="Beta")
+    assert beta.text.count("<tr>") == 6
+    assert get_view(client="Nobody").text == "<div>No opportunities found.</div>"
+
+
+def test_view_opportunity_escapes_and_caches_row_fragments(db, monkeypatch):
+    opportunity_id = main.save_opportunity_to_db({**OPPORTUNITY, "title": "<script>alert(1)</script>"}, None)
+    monkeypatch.setattr(main, "fragment_cache", main.FragmentCache())
+    assert "&lt;script&gt;" in get_view().text
+    get_view()
+    assert main.fragment_cache.stats()["hits"] == 1
+    # Any update bumps the revision, so the cached fragment is not reused
+    with db.transaction() as conn:
+        conn.execute("UPDATE opportunities SET insights = ? WHERE id = ?", ('{"recommendations": "new"}', opportunity_id))
+    assert "new" in get_view().text
+    assert main.fragment_cache.stats()["misses"] == 2
+
+
+def test_analytics_rollups_match_a_full_recomputation(db):
+    rng = random.Random(7)
+    skills = ["Python", "SQL", "Spark", "dbt"]
+
+    def opportunity(i):
+        return {**OPPORTUNITY, "type": rng.choice(["Analytics", "AI/ML", "Consulting"]),
+                "complexity": rng.choice(["Low", "High"]),
+                # Numeric clients are stored as TEXT and must group the same live and warmed
+                "client": f"client{i % 4}" if i % 3 else i % 4,
+                "skills": ", ".join(rng.sample(skills, 2)), "deal_value": rng.randrange(1000, 100000)}
+
+    for i in range(30):
+        main.save_opportunity_to_db(opportunity(i), None)
+    client = TestClient(main.app)
+    before = client.get("/analytics").json()
+    assert before["overall"]["count"] == 30
+    # Rows inserted after warming, one by one and in bulk, are rolled up incrementally
+    for i in range(30, 40):
+        main.save_opportunity_to_db(opportunity(i), None)
+    post_import("\n".join(json.dumps(opportunity(i)) for i in range(40, 60)).encode(), batch_size=7)
+    rows = db.connection().execute("SELECT * FROM opportunities").fetchall()
+
+    for dimension in ("type", "complexity", "client", "skill"):
+        incremental = client.get("/analytics", params={"group_by": dimension}).json()
+        expected = {}
+        for row in rows:
+            keys = parse_skills(row["skills"]) if dimension == "skill" else [row[dimension]]
+            for key in keys:
+                expected.setdefault(key, []).append(row["deal_value"])
+        assert {g["key"] for g in incremental["groups"]} == set(expected)
+        for group in incremental["groups"]:
+            values = expected[group["key"]]
+            assert group["count"] == len(values)
+            assert group["total_deal_value"] == pytest.approx(sum(values))
+            for pct in (25, 50, 75, 90):
+                assert group[f"p{pct}_deal_value"] == pytest.approx(np.percentile(values, pct))
+        totals = [g["total_deal_value"] for g in incremental["groups"]]
+        assert totals == sorted(totals, reverse=True)
+        # A fresh warm from the table agrees with the incrementally maintained rollups
+        rewarmed = main.Analytics()
+        rewarmed.warm(db)
+        assert rewarmed.summary(dimension) == incremental
+    assert client.get("/analytics").json()["overall"]["count"] == 60
+    assert client.get("/analytics", params={"group_by": "title"}).status_code == 422
+
+
+def test_parse_skills_normalizes_and_deduplicates():
+    assert parse_skills("Python, SQL;  machine   learning,python | CI/CD\n") == [
+        "python", "sql", "machine learning", "ci/cd"]
+    assert parse_skills("") == []
+
+
+def test_search_opportunities_intersects_skill_posting_lists(db):
+    rng = random.Random(3)
+    skills = ["Python", "SQL", "Spark", "dbt", "Airflow"]
+    expected = []
+    for i in range(60):
+        chosen = rng.sample(skills, rng.randrange(1, 4))
+        opportunity_id = main.save_opportunity_to_db({**OPPORTUNITY, "skills": ", ".join(chosen)}, None)
+        if {"Python", "SQL"} <= set(chosen):
+            expected.append(opportunity_id)
+    expected.reverse()
+    client = TestClient(main.app)
+    found, before = [], None
+    while True:
+        params = {"skill": ["python", " SQL "], "limit": 4}
+        if before is not None:
+            params["before"] = before
+        page = client.get("/opportunities", params=params).json()
+        found += [row["id"] for row in page["opportunities"]]
+        assert all("insights" not in row for row in page["opportunities"])
+        before = page["next_cursor"]
+        if before is None:
+            break
+    assert found == expected
+    assert client.get("/opportunities", params={"skill": ["python", "cobol"]}).json()["opportunities"] == []
+    counts = dict(db.connection().execute("SELECT name, opportunity_count FROM skills"))
+    assert counts["python"] == sum("Python" in row["skills"] for row in db.connection().execute(
+        "SELECT skills FROM opportunities"))
+
+
+def test_skills_backfill_indexes_existing_rows_in_batches(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    # A database from before skills were indexed
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE opportunities (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, "
+                     "client TEXT NOT NULL, contact_name TEXT NOT NULL, contact_email TEXT NOT NULL, "
+                     "description TEXT NOT NULL, type TEXT NOT NULL, complexity TEXT NOT NULL, "
+                     "duration TEXT NOT NULL, skills TEXT NOT NULL, deal_value REAL NOT NULL, insights TEXT)")
+        conn.executemany("INSERT INTO opportunities (title, client, contact_name, contact_email, description, type, "
+                         "complexity, duration, skills, deal_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(f"Old {i}", "Acme", "Sam", "s@a", "d", "t", "c", "1m", "Python, SQL" if i % 2 else "Go", 1)
+                          for i in range(10)])
+    init_db(path)
+    database = Database(path)
+    try:
+        batches = 1
+        while backfill_batch(database, batch_size=3):
+            batches += 1
+        assert batches == 4
+        assert not backfill_batch(database, batch_size=3)
+        with database.read() as conn:
+            assert search_by_skills(conn, ["python", "sql"], 100) == [10, 8, 6, 4, 2]
+            assert search_by_skills(conn, ["go"], 100) == [9, 7, 5, 3, 1]
+            counts = dict(conn.execute("SELECT name, opportunity_count FROM skills"))
+        assert counts == {"python": 5, "sql": 5, "go": 5}
+    finally:
+        database.close()
+
+
+def test_cancelled_skills_backfill_waits_for_its_batch(monkeypatch):
+    import skills
+    finished = []
+
+    def slow_batch(db, batch_size):
+        time.sleep(0.2)
+        finished.append(batch_size)
+        return True
+
+    class ThreadedDB:
+        async def run(self, fn, *args):
+            return await asyncio.to_thread(fn, *args)
+
+    monkeypatch.setattr(skills, "backfill_batch", slow_batch)
+
+    async def scenario():
+        task = asyncio.create_task(skills.backfill(ThreadedDB(), batch_size=5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return list(finished), task.cancelled()
+
+    assert asyncio.run(scenario()) == ([5], True)
+
+
+def test_non_string_skills_are_rejected(db):
+    rows = [json.dumps({**OPPORTUNITY, "skills": value}) for value in (5, ["python"])]
+    report = post_import("\n".join(rows + [json.dumps(OPPORTUNITY)]).encode()).json()
+    assert (report["imported"], report["failed"]) == (1, 2)
+    assert all("skills" in e["error"] for e in report["errors"])